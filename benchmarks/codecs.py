@@ -0,0 +1,87 @@
+"""
+Сравнение кодеков контекста с прежним способом (json.dumps/json.loads стандартной библиотеки).
+
+Для контекстов разного размера измеряется время кодирования и декодирования одного контекста
+и размер результата. Кодеки с неустановленными необязательными зависимостями пропускаются.
+
+    python -m benchmarks.codecs --output codecs.json
+"""
+import argparse
+import json
+import timeit
+import typing
+from pathlib import Path
+
+from src.lib import codecs
+from src.lib.state_machine import Context
+
+
+class _StdlibJson(codecs.ContextCodec):
+    """Прежний способ: стандартный json с настройками по умолчанию."""
+
+    name = "stdlib-json"
+
+    def encode(self, value: typing.Any) -> bytes:
+        return json.dumps(dict(value)).encode()
+
+    def decode(self, data: bytes) -> dict[str, typing.Any]:
+        return json.loads(data)
+
+
+def make_context(keys: int) -> Context:
+    """Контекст, похожий на реальный: строки, числа, списки ответов и вложенные словари."""
+    context = Context()
+    for i in range(keys):
+        match i % 4:
+            case 0:
+                context[f"text_{i}"] = f"Ответ пользователя номер {i}"
+            case 1:
+                context[f"number_{i}"] = i * 1.5
+            case 2:
+                context[f"answers_{i}"] = list(range(i % 10))
+            case 3:
+                context[f"nested_{i}"] = {"id": i, "title": "Раздел", "flags": [True, False]}
+    return context
+
+
+def available_codecs() -> list[codecs.ContextCodec]:
+    result: list[codecs.ContextCodec] = [_StdlibJson(), codecs.JsonCodec()]
+    if codecs.msgpack is not None:
+        result.append(codecs.MsgpackCodec())
+    return result
+
+
+def measure(codec: codecs.ContextCodec, context: Context, number: int) -> dict[str, float]:
+    encoded = codec.encode(context)
+    return {
+        "encode_us": timeit.timeit(lambda: codec.encode(context), number=number) / number * 1e6,
+        "decode_us": timeit.timeit(lambda: codec.decode(encoded), number=number) / number * 1e6,
+        "size_bytes": len(encoded),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 32, 256])
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--output", type=Path, help="файл для сохранения результатов в JSON")
+    args = parser.parse_args()
+
+    print(f"orjson: {'да' if codecs.orjson is not None else 'нет'}, msgpack: {'да' if codecs.msgpack else 'нет'}")
+    results = []
+    for keys in args.sizes:
+        context = make_context(keys)
+        for codec in available_codecs():
+            result = {"codec": codec.name, "keys": keys, **measure(codec, context, max(args.number // keys, 100))}
+            results.append(result)
+            print(
+                f"{keys:>4} ключей  {codec.name:<12} кодирование {result['encode_us']:8.2f} мкс"
+                f"  декодирование {result['decode_us']:8.2f} мкс  {result['size_bytes']:>6} байт"
+            )
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Общие части измерений: заглушки Telegram, учёт времени по этапам и синтетический сценарий бота."""
+import asyncio
+import contextvars
+import datetime
+import functools
+import statistics
+import time
+import typing
+
+from aiogram.methods import TelegramMethod
+from aiogram.types import (
+    CallbackQuery,
+    Chat,
+    KeyboardButton,
+    Message,
+    ReplyKeyboardMarkup,
+    ReplyKeyboardRemove,
+    User,
+)
+from dependency_injector import containers, providers
+
+from src.lib.outbox import Outbox, Priority
+from src.lib.state_machine import Action, ChatId, ChatSnapshot, Context, State, StateCode, StateMachineStorage
+from src.lib.state_machine.mixins import (
+    ClearVarsOnExit,
+    Keyboard,
+    RenderedViewOnEnter,
+    StaticViewOnEnter,
+    SwitchStateByMessage,
+    ValidateOnMessage,
+)
+from src.lib.state_machine.storages import AsyncSQLiteStorage, CachedStorage, MemoryStorage, SQLiteInMemoryStorage
+
+STORAGES = ("memory", "sqlite", "sqlite-async", "pg", "pg+cache")
+
+
+class Timings:
+    """Время обработки одного действия по этапам, в секундах, и состояние чата до действия."""
+
+    __slots__ = ("storage", "handler", "state_code")
+
+    def __init__(self) -> None:
+        self.storage = 0.0
+        self.handler = 0.0
+        self.state_code: StateCode | None = None
+
+
+current_timings: contextvars.ContextVar[Timings | None] = contextvars.ContextVar("current_timings", default=None)
+
+# Лимиты Telegram в измерениях не нужны: они измеряли бы ожидание, а не код
+_UNLIMITED_RATE = 1e9
+
+
+class StubBot:
+    """Заменяет Bot: записывает вызванные методы и сразу возвращает успех, без сети."""
+
+    def __init__(self) -> None:
+        self.methods: list[TelegramMethod] = []
+
+    async def __call__(self, method: TelegramMethod) -> bool:
+        self.methods.append(method)
+        return True
+
+
+class TimedOutbox(Outbox):
+    """
+    Настоящий Outbox с заглушкой Bot и без ограничений скорости.
+    Для каждого сообщения учитывается время от постановки в очередь до доставки, включая буфер действия.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(StubBot(), global_rate=_UNLIMITED_RATE, chat_rate=_UNLIMITED_RATE, chat_burst=_UNLIMITED_RATE)
+        self.send_times: list[float] = []
+
+    def send(self, chat_id: int, method: TelegramMethod, priority: Priority = Priority.REPLY) -> asyncio.Future:
+        started = time.perf_counter()
+        future = super().send(chat_id, method, priority)
+        future.add_done_callback(lambda _: self.send_times.append(time.perf_counter() - started))
+        return future
+
+
+_HOOKS = ("on_enter", "on_exit", "message_handler", "callback_handler", "after_action_switcher", "after_enter_switcher")
+
+
+def time_hooks(states: typing.Iterable[State]) -> list[State]:
+    """Учитывать время обработчиков состояний в текущем действии: методы оборачиваются на экземплярах."""
+    states = list(states)
+    for state in states:
+        for hook in _HOOKS:
+            setattr(state, hook, _timed_hook(getattr(state, hook)))
+    return states
+
+
+def _timed_hook(hook: typing.Callable[..., typing.Awaitable]) -> typing.Callable[..., typing.Awaitable]:
+    @functools.wraps(hook)
+    async def timed(*args, **kwargs) -> typing.Any:
+        started = time.perf_counter()
+        try:
+            return await hook(*args, **kwargs)
+        finally:
+            if (timings := current_timings.get()) is not None:
+                timings.handler += time.perf_counter() - started
+
+    return timed
+
+
+class TimedStorage(StateMachineStorage):
+    """Обёртка хранилища, учитывающая время его вызовов в текущем действии."""
+
+    def __init__(self, storage: StateMachineStorage) -> None:
+        self._storage = storage
+
+    async def _timed(self, coroutine: typing.Awaitable) -> typing.Any:
+        started = time.perf_counter()
+        try:
+            return await coroutine
+        finally:
+            if (timings := current_timings.get()) is not None:
+                timings.storage += time.perf_counter() - started
+
+    async def get_state(self, chat_id: ChatId) -> str | None:
+        return await self._timed(self._storage.get_state(chat_id))
+
+    async def set_state(self, chat_id: ChatId, state_name: str) -> None:
+        await self._timed(self._storage.set_state(chat_id, state_name))
+
+    async def get_context(self, chat_id: ChatId) -> Context | None:
+        return await self._timed(self._storage.get_context(chat_id))
+
+    async def set_context(self, chat_id: ChatId, context: Context) -> None:
+        await self._timed(self._storage.set_context(chat_id, context))
+
+    async def get_snapshot(self, chat_id: ChatId) -> ChatSnapshot:
+        snapshot = await self._timed(self._storage.get_snapshot(chat_id))
+        if (timings := current_timings.get()) is not None:
+            timings.state_code = snapshot.state_code
+        return snapshot
+
+    async def set_snapshot(self, chat_id: ChatId, snapshot: ChatSnapshot) -> None:
+        await self._timed(self._storage.set_snapshot(chat_id, snapshot))
+
+    async def restore_archived(self, chat_id: ChatId) -> ChatSnapshot | None:
+        return await self._timed(self._storage.restore_archived(chat_id))
+
+    def lock(self, chat_id: ChatId) -> typing.AsyncContextManager[None]:
+        return self._storage.lock(chat_id)
+
+
+class _BotContainer(containers.DeclarativeContainer):
+    outbox = providers.Singleton(TimedOutbox)
+
+
+class BenchmarkContainer(containers.DeclarativeContainer):
+    """Контейнер с заглушками вместо Telegram для внедрения в миксины состояний."""
+
+    bot = providers.Container(_BotContainer)
+
+
+def make_container() -> BenchmarkContainer:
+    container = BenchmarkContainer()
+    container.wire(modules=["src.lib.state_machine.mixins"])
+    return container
+
+
+async def make_storage(name: str, pg_url: str | None = None) -> tuple[StateMachineStorage, typing.Callable]:
+    """
+    Создать хранилище по имени. Возвращает хранилище и корутинную функцию его закрытия.
+    Суффикс «+cache» оборачивает хранилище в CachedStorage.
+    """
+    if name.endswith("+cache"):
+        storage, close = await make_storage(name.removesuffix("+cache"), pg_url)
+        return CachedStorage(storage), close
+    if name == "memory":
+        return MemoryStorage(), _noop
+    if name == "sqlite":
+        return SQLiteInMemoryStorage(), _noop
+    if name == "sqlite-async":
+        storage = AsyncSQLiteStorage()
+        return storage, storage.close
+    if name == "pg":
+        from databases import Database
+
+        from src.lib.di import asyncpg_init
+        from src.lib.state_machine.storages import PGStateMachineStorage
+
+        assert pg_url is not None, "Для хранилища pg требуется адрес базы данных"
+        db = Database(pg_url, init=asyncpg_init)
+        await db.connect()
+        return PGStateMachineStorage(db), db.disconnect
+    raise ValueError(f"Неизвестное хранилище «{name}»")
+
+
+async def _noop() -> None:
+    pass
+
+
+# Синтетический сценарий: главное меню, анкета с проверкой ввода и справка с автоматическим возвратом.
+
+
+class Menu(SwitchStateByMessage, StaticViewOnEnter, State):
+    text = "Главное меню"
+    keyboard = ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text="Анкета"), KeyboardButton(text="Справка")]])
+    static_routes = {"Анкета": StateCode("Form"), "Справка": StateCode("Help")}
+
+    async def callback_handler(self, query: CallbackQuery, chat_id: ChatId, context: Context) -> None:
+        context["callbacks"] = context.get("callbacks", 0) + 1
+
+
+class Form(ValidateOnMessage[int], RenderedViewOnEnter, ClearVarsOnExit, State):
+    clearing_context_keys = ("form_attempts",)
+    view_dependencies = ("form_attempts",)
+    transitions = (StateCode("Menu"),)
+
+    async def render_text(self, chat_id: ChatId, context: Context) -> str:
+        return f"Введите число (попытка {context.get('form_attempts', 0) + 1})"
+
+    async def render_keyboard(self, chat_id: ChatId, context: Context) -> Keyboard:
+        return ReplyKeyboardRemove()
+
+    async def validator(self, message: Message) -> int | None:
+        return int(message.text) if message.text and message.text.isdigit() else None
+
+    async def on_correct(self, result: int, chat_id: ChatId, context: Context) -> None:
+        context["answers"] = [*context.get("answers", []), result]
+
+    async def message_handler(self, message: Message, chat_id: ChatId, context: Context) -> None:
+        context["form_attempts"] = context.get("form_attempts", 0) + 1
+        await super().message_handler(message, chat_id, context)
+
+    async def after_action_switcher(self, action: Action, context: Context) -> StateCode | None:
+        if isinstance(action, Message) and action.text and action.text.isdigit():
+            return StateCode("Menu")
+
+
+class Help(StaticViewOnEnter, State):
+    text = "Справка"
+    keyboard = ReplyKeyboardRemove()
+    transitions = (StateCode("Menu"),)
+
+    async def after_enter_switcher(self, context: Context) -> StateCode | None:
+        return StateCode("Menu")
+
+
+def make_states() -> list[State]:
+    return [Menu(), Form(), Help()]
+
+
+DEFAULT_STATE = StateCode("Menu")
+
+# Действия одного чата: первое сообщение переводит нового пользователя в меню.
+SCRIPT: tuple[str, ...] = ("/start", "Анкета", "abc", "42", "Справка", "callback", "Анкета", "7", "что-то")
+
+
+def make_message(chat_id: int, message_id: int, text: str) -> Message:
+    return Message(
+        message_id=message_id,
+        date=datetime.datetime.now(),
+        chat=Chat(id=chat_id, type="private"),
+        from_user=User(id=chat_id, is_bot=False, first_name="Benchmark"),
+        text=text,
+    )
+
+
+def make_callback_query(chat_id: int, query_id: int, data: str) -> CallbackQuery:
+    return CallbackQuery(
+        id=str(query_id),
+        from_user=User(id=chat_id, is_bot=False, first_name="Benchmark"),
+        chat_instance=str(chat_id),
+        data=data,
+    )
+
+
+def make_actions(chat_id: int) -> list[Action]:
+    """Действия чата по сценарию SCRIPT."""
+    return [
+        make_callback_query(chat_id, i, "menu") if text == "callback" else make_message(chat_id, i, text)
+        for i, text in enumerate(SCRIPT)
+    ]
+
+
+def percentiles(values: typing.Sequence[float]) -> dict[str, float]:
+    """p50/p95/p99 и максимум в миллисекундах."""
+    if len(values) < 2:
+        value = values[0] * 1000 if values else 0.0
+        return {"p50": value, "p95": value, "p99": value, "max": value}
+    quantiles = statistics.quantiles(values, n=100, method="inclusive")
+    return {
+        "p50": quantiles[49] * 1000,
+        "p95": quantiles[94] * 1000,
+        "p99": quantiles[98] * 1000,
+        "max": max(values) * 1000,
+    }
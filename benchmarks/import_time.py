@@ -0,0 +1,75 @@
+"""
+Время импорта точки входа бота – оценка холодного старта.
+
+Импорт выполняется в отдельном процессе с python -X importtime, поэтому кеш модулей текущего процесса
+не влияет на результат. Выводится общее время и самые долгие пакеты верхнего уровня; если время превышает
+бюджет, скрипт завершается с кодом 1, что позволяет проверять бюджет в CI.
+
+    python -m benchmarks.import_time --budget-ms 1500 --output import_time.json
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure(module: str) -> dict[str, int]:
+    """Собственное время импорта (мкс) каждого модуля, импортированного при импорте module."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        sys.exit(f"Не удалось импортировать {module}:\n{completed.stderr.splitlines()[-1]}")
+    result = {}
+    for line in completed.stderr.splitlines():
+        if (match := _LINE.match(line)) is not None:
+            result[match[4]] = int(match[1])
+    return result
+
+
+def by_package(modules: dict[str, int]) -> dict[str, int]:
+    """Суммарное собственное время модулей по пакетам верхнего уровня."""
+    result: dict[str, int] = defaultdict(int)
+    for name, self_us in modules.items():
+        result[name.partition(".")[0]] += self_us
+    return dict(sorted(result.items(), key=lambda item: item[1], reverse=True))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="src.start", help="импортируемый модуль")
+    parser.add_argument("--repeat", type=int, default=5, help="количество запусков, берётся медиана")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, help="допустимое время импорта")
+    parser.add_argument("--output", type=Path, help="файл для сохранения результатов в JSON")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeat)]
+    totals = [sum(run.values()) / 1000 for run in runs]
+    total_ms = statistics.median(totals)
+    median_run = sorted(range(len(runs)), key=totals.__getitem__)[len(runs) // 2]
+    packages = by_package(runs[median_run])
+
+    print(f"{args.module}: {total_ms:.0f} мс (медиана {args.repeat} запусков), модулей: {len(runs[0])}")
+    for package, self_us in list(packages.items())[: args.top]:
+        print(f"  {package:<24} {self_us / 1000:8.1f} мс")
+
+    if args.output is not None:
+        result = {"module": args.module, "total_ms": total_ms, "runs_ms": totals, "packages_us": packages}
+        args.output.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"Бюджет {args.budget_ms:.0f} мс превышен на {total_ms - args.budget_ms:.0f} мс")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
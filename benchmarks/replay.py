@@ -0,0 +1,152 @@
+"""
+Воспроизведение записанного трафика (capture.mode = "on") через StateMachine.handle_action.
+
+Обновления из записи подаются с исходными интервалами, ускоренными в --speed раз (0 – без пауз, так быстро,
+как возможно); действия одного чата обрабатываются в исходном порядке через ChatScheduler. Сообщения проходят
+через Outbox с заглушкой Bot API, хранилище – локальное, состояния берутся из модуля --states (make_states()
+и DEFAULT_STATE).
+Результат – задержки действий с разбивкой по коду состояния чата до действия и отставание от расписания.
+
+    python -m benchmarks.replay captures/capture-20231101-120000-1.jsonl.gz --speed 10 --storage sqlite-async
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import gzip
+import importlib
+import json
+import platform
+import time
+import typing
+from pathlib import Path
+
+from aiogram.types import Update
+
+from src.lib.state_machine import Action, StateCode, StateMachine
+from src.lib.state_machine.scheduler import ChatScheduler
+
+from . import harness
+
+LOCAL_STORAGES = tuple(name for name in harness.STORAGES if not name.startswith("pg"))
+
+_NEW_CHAT = "<новый чат>"
+
+
+def load_capture(path: Path) -> list[tuple[float, Action]]:
+    """Прочитать запись: время получения и действие, в порядке записи."""
+    actions = []
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            update = Update.model_validate(record["update"])
+            action = update.message or update.callback_query
+            if action is not None:
+                actions.append((record["t"], action))
+    return actions
+
+
+async def run(
+    capture: typing.Sequence[tuple[float, Action]],
+    states_module: str,
+    storage_name: str,
+    speed: float,
+    max_concurrency: int,
+) -> dict:
+    states = importlib.import_module(states_module)
+    container = harness.make_container()
+    storage, close_storage = await harness.make_storage(storage_name)
+    outbox = container.bot.outbox()
+    state_machine = StateMachine(
+        states.make_states(), states.DEFAULT_STATE, harness.TimedStorage(storage), outbox=outbox
+    )
+
+    totals: dict[StateCode | None, list[float]] = collections.defaultdict(list)
+    storage_times: list[float] = []
+    lags: list[float] = []
+
+    async def handle(action: Action) -> None:
+        timings = harness.Timings()
+        harness.current_timings.set(timings)
+        started = time.perf_counter()
+        await state_machine.handle_action(action)
+        totals[timings.state_code].append(time.perf_counter() - started)
+        storage_times.append(timings.storage)
+
+    scheduler = ChatScheduler(handle, max_concurrency=max_concurrency)
+    handling = []
+    first_t = capture[0][0] if capture else 0.0
+    started = time.perf_counter()
+    for t, action in capture:
+        if speed > 0:
+            due = started + (t - first_t) / speed
+            if (delay := due - time.perf_counter()) > 0:
+                await asyncio.sleep(delay)
+            lags.append(max(0.0, time.perf_counter() - due))
+        # Задачи запускаются в порядке создания, поэтому действия одного чата встают в очередь в порядке записи
+        handling.append(asyncio.create_task(scheduler.handle_action(action)))
+    await asyncio.gather(*handling)
+    elapsed = time.perf_counter() - started
+    await outbox.close()
+    await close_storage()
+
+    by_state = {
+        _NEW_CHAT if state_code is None else state_code: {"actions": len(values), **harness.percentiles(values)}
+        for state_code, values in sorted(totals.items(), key=lambda item: -len(item[1]))
+    }
+    return {
+        "storage": storage_name,
+        "states": states_module,
+        "speed": speed,
+        "actions": len(capture),
+        "chats": len({action.from_user.id for _, action in capture}),
+        "captured_s": capture[-1][0] - first_t if capture else 0.0,
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(capture) / elapsed if elapsed > 0 else 0.0,
+        "messages_sent": outbox.sent,
+        "latency_ms": {
+            "total": harness.percentiles([value for values in totals.values() for value in values]),
+            "storage": harness.percentiles(storage_times),
+            "send": harness.percentiles(outbox.send_times),
+            "schedule_lag": harness.percentiles(lags),
+        },
+        "latency_by_state_ms": by_state,
+        "python": platform.python_version(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def print_report(result: dict) -> None:
+    print(
+        f"{result['storage']}: {result['actions']} действий в {result['chats']} чатах"
+        f" (записано за {result['captured_s']:.1f} с) воспроизведено за {result['elapsed_s']:.2f} с"
+        f" – {result['throughput_per_s']:.0f} действий/с"
+    )
+    for stage, latency in result["latency_ms"].items():
+        print(f"  {stage:<12} " + "  ".join(f"{name} {value:8.3f} мс" for name, value in latency.items()))
+    print("  по состояниям:")
+    for state_code, latency in result["latency_by_state_ms"].items():
+        actions = latency["actions"]
+        values = "  ".join(f"{name} {value:8.3f} мс" for name, value in latency.items() if name != "actions")
+        print(f"    {state_code:<20} {actions:>7}  {values}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", type=Path, help="файл записи *.jsonl.gz")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение относительно записи; 0 – без пауз")
+    parser.add_argument("--storage", choices=LOCAL_STORAGES, default="memory")
+    parser.add_argument("--states", default="benchmarks.harness", help="модуль с make_states() и DEFAULT_STATE")
+    parser.add_argument("--max-concurrency", type=int, default=100)
+    parser.add_argument("--output", type=Path, help="файл для сохранения результата в JSON")
+    args = parser.parse_args()
+
+    capture = load_capture(args.capture)
+    result = asyncio.run(run(capture, args.states, args.storage, args.speed, args.max_concurrency))
+    print_report(result)
+    if args.output is not None:
+        args.output.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
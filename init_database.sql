@@ -1,3 +1,5 @@
+-- Схема новой базы. Базу, созданную прежней версией этого файла, обновляет migrate_database.sql.
+
 create or replace function set_updated_at() returns trigger
     language plpgsql as
 $$
@@ -47,6 +49,7 @@ create table bot.chat_state
 (
     chat_id    bigint primary key,
     state_code text not null,
+    seen_at    timestamp default current_timestamp,
     created_at timestamp default current_timestamp,
     updated_at timestamp default current_timestamp
 );
@@ -58,6 +61,7 @@ execute procedure set_updated_at();
 comment on table bot.chat_state is 'Состояния чатов';
 comment on column bot.chat_state.chat_id is 'Идентификатор чата';
 comment on column bot.chat_state.state_code is 'Код состояния чата';
+comment on column bot.chat_state.seen_at is 'Время последнего действия пользователя с точностью до суток';
 
 create table bot.chat_context
 (
@@ -74,3 +78,99 @@ execute procedure set_updated_at();
 comment on table bot.chat_context is 'Контекст чатов';
 comment on column bot.chat_context.chat_id is 'Идентификатор чата';
 comment on column bot.chat_context.context is 'Контекст чата';
+
+-- Поиск бездействующих чатов для архивации (см. ChatArchiver). seen_at обновляется не чаще раза в сутки,
+-- поэтому остальные обновления chat_state остаются HOT; chat_context не индексируется совсем.
+create index chat_state_seen_at on bot.chat_state (seen_at);
+
+-- Запас места на страницах для HOT-обновлений и более частая очистка мёртвых строк.
+alter table bot.chat_state set (fillfactor = 90, autovacuum_vacuum_scale_factor = 0.05);
+alter table bot.chat_context set (fillfactor = 90, autovacuum_vacuum_scale_factor = 0.05);
+
+create table bot.chat_archive
+(
+    chat_id        bigint primary key,
+    state_code     text      not null,
+    context        jsonb,
+    last_active_at timestamp not null,
+    archived_at    timestamp default current_timestamp
+);
+comment on table bot.chat_archive is 'Чаты, перенесённые из chat_state и chat_context после долгого бездействия';
+comment on column bot.chat_archive.chat_id is 'Идентификатор чата';
+comment on column bot.chat_archive.state_code is 'Код состояния чата';
+comment on column bot.chat_archive.context is 'Контекст чата';
+comment on column bot.chat_archive.last_active_at is 'Время последнего действия пользователя (chat_state.seen_at)';
+comment on column bot.chat_archive.archived_at is 'Время переноса в архив';
+
+
+-- Уведомление процессов бота об изменении статических данных (см. StaticLoader.listen)
+create or replace function notify_static_changed() returns trigger
+    language plpgsql as
+$$
+begin
+    perform pg_notify(
+        'static_changed',
+        json_build_object('table', tg_table_name, 'code', coalesce(new.code, old.code))::text
+    );
+    return null;
+end;
+$$;
+
+create trigger texts_notify_changed
+    after insert or update or delete
+    on texts
+    for each row
+execute procedure notify_static_changed();
+
+create trigger files_notify_changed
+    after insert or update or delete
+    on files
+    for each row
+execute procedure notify_static_changed();
+
+
+create table file_telegram_ids
+(
+    code         text primary key references files (code) on update cascade on delete cascade,
+    content_hash text not null,
+    file_id      text not null,
+    created_at   timestamp default current_timestamp,
+    updated_at   timestamp default current_timestamp
+);
+create trigger file_telegram_ids_updated_at
+    before update
+    on file_telegram_ids
+    for each row
+execute procedure set_updated_at();
+comment on table file_telegram_ids is 'Идентификаторы статических файлов, уже загруженных в Telegram';
+comment on column file_telegram_ids.code is 'Символьный код файла';
+comment on column file_telegram_ids.content_hash is 'SHA-256 содержимого файла на момент загрузки';
+comment on column file_telegram_ids.file_id is 'Идентификатор файла в Telegram';
+
+
+create table bot.broadcast
+(
+    id           bigint generated always as identity primary key,
+    text         text    not null,
+    file_code    text references files (code) on update cascade on delete set null,
+    last_chat_id bigint,
+    delivered    integer not null default 0,
+    failed       integer not null default 0,
+    blocked      integer not null default 0,
+    created_at   timestamp default current_timestamp,
+    updated_at   timestamp default current_timestamp,
+    finished_at  timestamp
+);
+create trigger broadcast_updated_at
+    before update
+    on bot.broadcast
+    for each row
+execute procedure set_updated_at();
+comment on table bot.broadcast is 'Рассылки всем известным чатам и их прогресс';
+comment on column bot.broadcast.text is 'Текст сообщения или подпись к изображению';
+comment on column bot.broadcast.file_code is 'Код изображения';
+comment on column bot.broadcast.last_chat_id is 'Последний чат обработанной пачки, с него рассылка продолжается';
+comment on column bot.broadcast.delivered is 'Доставлено сообщений';
+comment on column bot.broadcast.failed is 'Не удалось отправить';
+comment on column bot.broadcast.blocked is 'Пользователь заблокировал бота';
+comment on column bot.broadcast.finished_at is 'Время завершения рассылки';
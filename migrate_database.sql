@@ -0,0 +1,56 @@
+-- Обновление базы, созданной прежней версией init_database.sql. Выполняется повторно без ошибок
+-- (create or replace trigger – PostgreSQL 14 и новее).
+
+-- Время последнего действия пользователя и архив бездействующих чатов (см. ChatArchiver)
+alter table bot.chat_state add column if not exists seen_at timestamp default current_timestamp;
+comment on column bot.chat_state.seen_at is 'Время последнего действия пользователя с точностью до суток';
+
+drop index if exists bot.chat_state_updated_at;
+create index if not exists chat_state_seen_at on bot.chat_state (seen_at);
+
+alter table bot.chat_state set (fillfactor = 90, autovacuum_vacuum_scale_factor = 0.05);
+alter table bot.chat_context set (fillfactor = 90, autovacuum_vacuum_scale_factor = 0.05);
+
+create table if not exists bot.chat_archive
+(
+    chat_id        bigint primary key,
+    state_code     text      not null,
+    context        jsonb,
+    last_active_at timestamp not null,
+    archived_at    timestamp default current_timestamp
+);
+comment on table bot.chat_archive is 'Чаты, перенесённые из chat_state и chat_context после долгого бездействия';
+comment on column bot.chat_archive.chat_id is 'Идентификатор чата';
+comment on column bot.chat_archive.state_code is 'Код состояния чата';
+comment on column bot.chat_archive.context is 'Контекст чата';
+comment on column bot.chat_archive.last_active_at is 'Время последнего действия пользователя (chat_state.seen_at)';
+comment on column bot.chat_archive.archived_at is 'Время переноса в архив';
+
+
+-- Рассылки (python -m src.broadcast)
+create table if not exists bot.broadcast
+(
+    id           bigint generated always as identity primary key,
+    text         text    not null,
+    file_code    text references files (code) on update cascade on delete set null,
+    last_chat_id bigint,
+    delivered    integer not null default 0,
+    failed       integer not null default 0,
+    blocked      integer not null default 0,
+    created_at   timestamp default current_timestamp,
+    updated_at   timestamp default current_timestamp,
+    finished_at  timestamp
+);
+create or replace trigger broadcast_updated_at
+    before update
+    on bot.broadcast
+    for each row
+execute procedure set_updated_at();
+comment on table bot.broadcast is 'Рассылки всем известным чатам и их прогресс';
+comment on column bot.broadcast.text is 'Текст сообщения или подпись к изображению';
+comment on column bot.broadcast.file_code is 'Код изображения';
+comment on column bot.broadcast.last_chat_id is 'Последний чат обработанной пачки, с него рассылка продолжается';
+comment on column bot.broadcast.delivered is 'Доставлено сообщений';
+comment on column bot.broadcast.failed is 'Не удалось отправить';
+comment on column bot.broadcast.blocked is 'Пользователь заблокировал бота';
+comment on column bot.broadcast.finished_at is 'Время завершения рассылки';
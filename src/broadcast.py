@@ -0,0 +1,84 @@
+"""
+Рассылка сообщения всем известным чатам.
+
+    python -m src.broadcast new --text "Текст" [--file-code images/1]
+    python -m src.broadcast resume <идентификатор>
+
+Прерванную рассылку (остановленную или упавшую) можно продолжить командой resume.
+
+Рассылка отправляет сообщения через собственную очередь, параллельно работающему боту. Ограничение Telegram
+на бота общее (TELEGRAM_GLOBAL_RATE), поэтому по умолчанию рассылка занимает только запас, который оставляют
+процессы бота: TELEGRAM_GLOBAL_RATE - bot.send_rate * workers.count.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+
+import asyncpg
+from aiogram import Bot
+from dependency_injector import providers
+from dependency_injector.wiring import inject, Provide
+
+from src.config import Config, StaticConfig
+from src.container import Container
+from src.lib.broadcast import Broadcaster
+from src.lib.outbox import TELEGRAM_GLOBAL_RATE, Outbox
+from src.lib.static_loader import StaticLoader
+from src.start import run
+
+
+@inject
+async def broadcast(
+    args: argparse.Namespace,
+    bot: Bot = Provide["bot.client"],
+    pool: asyncpg.Pool = Provide["pg_pool"],
+    static: StaticConfig | None = Provide["config.provided.static"],
+    static_loader: providers.Provider[StaticLoader] = Provide["static_loader.provider"],
+) -> None:
+    loader = None
+    if static is not None:
+        loader = await static_loader()
+        await loader.preload()
+    outbox = Outbox(bot, global_rate=args.rate)
+    broadcaster = Broadcaster(pool, outbox, loader, batch_size=args.batch_size)
+    try:
+        broadcast_id = args.id if args.command == "resume" else await broadcaster.create(args.text, args.file_code)
+        logging.info("Рассылка %d", broadcast_id)
+        stats = await broadcaster.run(broadcast_id)
+        logging.info("Рассылка %d завершена: %s", broadcast_id, stats)
+    finally:
+        await outbox.close()
+        await bot.session.close()
+
+
+def headroom(config: Config) -> float:
+    """Скорость отправки, которую процессы бота оставляют рассылке в пределах ограничения Telegram."""
+    return TELEGRAM_GLOBAL_RATE - config.bot.send_rate * config.workers.count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--rate", type=float, help="сообщений в секунду; по умолчанию – запас, оставленный ботом")
+    commands = parser.add_subparsers(dest="command", required=True)
+    new = commands.add_parser("new", help="начать новую рассылку")
+    new.add_argument("--text", required=True, help="текст сообщения (HTML) или подпись к изображению")
+    new.add_argument("--file-code", help="код изображения из таблицы files")
+    resume = commands.add_parser("resume", help="продолжить прерванную рассылку")
+    resume.add_argument("id", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    container = Container()
+    container.wire(modules=[__name__])
+    config = container.config()
+    if args.rate is None:
+        args.rate = headroom(config)
+        if args.rate <= 0:
+            parser.error("бот занимает всё ограничение Telegram: уменьшите bot.send_rate или укажите --rate")
+    run(broadcast(args), config.runtime)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,24 @@
+import typing
 from pathlib import Path
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class WebhookConfig(BaseModel):
+    secret_token: str
+    url: str | None = None  # публичный адрес, который будет передан в setWebhook
+    path: str = "/webhook"
+    host: str = "0.0.0.0"
+    port: int = 8080
+
+
 class TelegramBotConfig(BaseModel):
     token: str
+    mode: typing.Literal["polling", "webhook"] = "polling"
+    webhook: WebhookConfig | None = None
+    # Сообщений в секунду на процесс. Запас до ограничения Telegram (30 в секунду) остаётся рассылкам
+    send_rate: float = 25
 
 
 class SQLiteConfig(BaseModel):
@@ -22,17 +35,128 @@ class PostgreSQLConfig(BaseModel):
     user: str
     password: str
     name: str
+    pool_min_size: int = 2
+    pool_max_size: int = 10  # единственный пул процесса (asyncpg): хранилище, StaticLoader и архивация
 
     @property
     def url(self) -> str:
         return f"postgresql+asyncpg://{self.user}:{self.password}@{self.host}:{self.port}/{self.name}"
 
+    @property
+    def dsn(self) -> str:
+        """Адрес для asyncpg."""
+        return f"postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.name}"
+
+
+class StaticConfig(BaseModel):
+    default_text: str
+    default_image_path: str
+    root: Path = Path("static")
+    manifest: Path | None = None  # манифест сборки статики (python -m src.lib.static_build)
+
+
+class RuntimeConfig(BaseModel):
+    debug: bool = False  # режим отладки asyncio замедляет каждую корутину, только для разработки
+    event_loop: typing.Literal["asyncio", "uvloop"] = "asyncio"  # uvloop – необязательная зависимость
+    ready_file: Path | None = None  # создаётся, когда процесс готов принимать обновления
+
+
+class SchedulerConfig(BaseModel):
+    max_concurrency: int = 100
+
+
+class WorkersConfig(BaseModel):
+    count: int = 1  # при count > 1 обновления распределяются по процессам по идентификатору пользователя
+    # Защищать состояние чата advisory-блокировкой PostgreSQL. Каждое действие держит соединение пула
+    # от чтения до записи состояния, поэтому db.pool_max_size должен превышать scheduler.max_concurrency
+    advisory_locks: bool = False
+
+
+class StorageConfig(BaseModel):
+    backend: typing.Literal["pg", "pg_buffered", "sqlite"] = "pg"  # где хранить состояние и контекст чатов
+    # pg_buffered: отложенная запись пакетами (см. BufferedPGStateMachineStorage)
+    flush_interval: float = 0.05
+    max_batch_size: int = 1000
+    durability: typing.Literal["buffer", "flush"] = "flush"
+    # sqlite: локальный файл, только для одного процесса (workers.count = 1)
+    sqlite_path: Path = Path("chats.sqlite3")
+
+
+class CacheConfig(BaseModel):
+    mode: typing.Literal["on", "off"] = "off"  # кешировать состояние недавно активных чатов в памяти
+    max_chats: int = 10_000
+    max_bytes: int = 64 * 1024 * 1024  # суммарный размер сериализованных контекстов
+    ttl: float = 600  # через сколько секунд перечитывать чат из базы
+
+
+class ArchiveConfig(BaseModel):
+    # on – переносить бездействующие чаты в bot.chat_archive и возвращать их при следующем действии;
+    # restore – только возвращать уже перенесённые (после выключения архивации)
+    mode: typing.Literal["on", "restore", "off"] = "off"
+    idle_days: int = Field(90, ge=1)  # не меньше суток: время последнего действия хранится с точностью до суток
+    interval: float = 3600  # секунд между запусками обслуживания
+    batch_size: int = 1000
+
+    @property
+    def restores(self) -> bool:
+        """Искать в архиве чаты без состояния."""
+        return self.mode != "off"
+
+
+class CaptureConfig(BaseModel):
+    mode: typing.Literal["on", "off"] = "off"  # записывать входящие обновления для benchmarks/replay.py
+    directory: Path = Path("captures")
+    salt: str | None = None  # общая соль – одинаковые идентификаторы в разных записях; по умолчанию случайная
+    keep_texts: list[str] = []  # тексты, которые не нужно маскировать, помимо static_routes состояний
+
+
+class MetricsConfig(BaseModel):
+    mode: typing.Literal["on", "off"] = "off"  # при "off" измерения не выполняются совсем
+    host: str = "0.0.0.0"
+    port: int = 9100
+
 
 class Config(BaseSettings):
     bot: TelegramBotConfig
 
     db: PostgreSQLConfig
 
+    static: StaticConfig | None = None  # без настройки статика не загружается заранее
+
+    runtime: RuntimeConfig = RuntimeConfig()
+
+    scheduler: SchedulerConfig = SchedulerConfig()
+
+    workers: WorkersConfig = WorkersConfig()
+
+    storage: StorageConfig = StorageConfig()
+
+    cache: CacheConfig = CacheConfig()
+
+    archive: ArchiveConfig = ArchiveConfig()
+
+    capture: CaptureConfig = CaptureConfig()
+
+    metrics: MetricsConfig = MetricsConfig()
+
+    @model_validator(mode="after")
+    def _check_archive_storage(self) -> "Config":
+        # Архиватор пропускает чаты под advisory-блокировкой, а её поддерживает только хранилище pg
+        if self.archive.mode == "on" and self.storage.backend != "pg":
+            raise ValueError("archive.mode = on поддерживается только с storage.backend = pg")
+        if self.archive.mode == "on" and not self.workers.advisory_locks:
+            raise ValueError("archive.mode = on требует workers.advisory_locks = true")
+        return self
+
+    @model_validator(mode="after")
+    def _check_pool_size(self) -> "Config":
+        # Под блокировкой действие занимает соединение целиком, ещё одно держит StaticLoader.listen
+        if self.workers.advisory_locks and self.db.pool_max_size <= self.scheduler.max_concurrency:
+            raise ValueError(
+                "при workers.advisory_locks = true db.pool_max_size должен быть больше scheduler.max_concurrency"
+            )
+        return self
+
     model_config = SettingsConfigDict(
         str_strip_whitespace=True,
         env_nested_delimiter=".",
@@ -1,8 +1,28 @@
+import datetime
+
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from dependency_injector import containers, providers
 
 from src.config import Config, TelegramBotConfig
+from src.lib.di import (
+    async_sqlite_storage,
+    asyncpg_pool,
+    asyncpg_storage,
+    buffered_pg_storage,
+    cached_storage,
+    pool_usage_gauge,
+)
+from src.lib.metrics import Registry
+from src.lib.outbox import Outbox
+from src.lib.readiness import Readiness
+from src.lib.recorder import TrafficRecorder, route_texts
+from src.lib.state_machine import StateMachine
+from src.lib.state_machine.archiver import ChatArchiver
+from src.lib.state_machine.instrumentation import StateMachineMetrics
+from src.lib.state_machine.scheduler import ChatScheduler
+from src.lib.static_build import load_manifest
+from src.lib.static_loader import StaticLoader, static_query_histogram
 
 
 class BotContainer(containers.DeclarativeContainer):
@@ -14,6 +34,12 @@ class BotContainer(containers.DeclarativeContainer):
         parse_mode=ParseMode.HTML,
     )
 
+    outbox = providers.Singleton(
+        Outbox,
+        bot=client,
+        global_rate=config.provided.send_rate,
+    )
+
     dispatcher = providers.Singleton(
         Dispatcher,
         storage=None,
@@ -31,15 +57,130 @@ class Container(containers.DeclarativeContainer):
         config=config.provided.bot,
     )
 
+    pg_pool = providers.Resource(
+        asyncpg_pool,
+        dsn=config.provided.db.dsn,
+        min_size=config.provided.db.pool_min_size,
+        max_size=config.provided.db.pool_max_size,
+    )
+
+    background_tasks = providers.Singleton(set)
+
+    readiness = providers.Singleton(
+        Readiness,
+        file=config.provided.runtime.ready_file,
+    )
+
+    metrics = providers.Singleton(Registry)
+
+    state_machine_metrics = providers.Selector(
+        config.provided.metrics.mode,
+        on=providers.Singleton(StateMachineMetrics, registry=metrics),
+        off=providers.Object(None),
+    )
+
+    static_query_duration = providers.Selector(
+        config.provided.metrics.mode,
+        on=providers.Singleton(static_query_histogram, registry=metrics),
+        off=providers.Object(None),
+    )
+
+    static_loader = providers.Singleton(
+        StaticLoader,
+        pool=pg_pool,
+        default_text=config.provided.static.default_text,
+        default_image_path=config.provided.static.default_image_path,
+        static_root=config.provided.static.root,
+        query_duration=static_query_duration,
+        manifest=providers.Callable(
+            load_manifest,
+            path=config.provided.static.manifest,
+        ),
+    )
+
+    archiver = providers.Selector(
+        config.provided.archive.mode,
+        on=providers.Singleton(
+            ChatArchiver,
+            pool=pg_pool,
+            idle_after=providers.Factory(datetime.timedelta, days=config.provided.archive.idle_days),
+            interval=config.provided.archive.interval,
+            batch_size=config.provided.archive.batch_size,
+        ),
+        restore=providers.Object(None),
+        off=providers.Object(None),
+    )
+
+    db_pool_gauge = providers.Singleton(
+        pool_usage_gauge,
+        pool=pg_pool,
+    )
+
     states = providers.List(
     )
 
+    # Код состояния, в которое попадает новый чат; задаётся вместе со states
+    default_state_code = providers.Dependency(instance_of=str)
+
+    persistent_storage = providers.Selector(
+        config.provided.storage.backend,
+        pg=providers.Singleton(
+            asyncpg_storage,
+            pool=pg_pool,
+            advisory_lock=config.provided.workers.advisory_locks,
+        ),
+        pg_buffered=providers.Resource(
+            buffered_pg_storage,
+            pool=pg_pool,
+            flush_interval=config.provided.storage.flush_interval,
+            max_batch_size=config.provided.storage.max_batch_size,
+            durability=config.provided.storage.durability,
+        ),
+        sqlite=providers.Resource(
+            async_sqlite_storage,
+            db_path=config.provided.storage.sqlite_path,
+        ),
+    )
+
+    storage = providers.Selector(
+        config.provided.cache.mode,
+        on=providers.Singleton(
+            cached_storage,
+            storage=persistent_storage,
+            max_chats=config.provided.cache.max_chats,
+            max_bytes=config.provided.cache.max_bytes,
+            ttl=config.provided.cache.ttl,
+        ),
+        off=persistent_storage,
+    )
+
     state_machine = providers.Singleton(
         StateMachine,
         states=states,
-        default_state_code=default_state.code,
-        storage=providers.Singleton(
-            PGStateMachineStorage,
-            db=_db,
+        default_state_code=default_state_code,
+        storage=storage,
+        metrics=state_machine_metrics,
+        outbox=bot.outbox,
+        restore_archived=config.provided.archive.restores,
+    )
+
+    recorder = providers.Selector(
+        config.provided.capture.mode,
+        on=providers.Singleton(
+            TrafficRecorder,
+            directory=config.provided.capture.directory,
+            salt=config.provided.capture.salt,
+            keep_texts=providers.Callable(
+                route_texts,
+                states=states,
+                extra=config.provided.capture.keep_texts,
+            ),
         ),
+        off=providers.Object(None),
+    )
+
+    scheduler = providers.Singleton(
+        ChatScheduler,
+        handler=state_machine.provided.handle_action,
+        max_concurrency=config.provided.scheduler.max_concurrency,
     )
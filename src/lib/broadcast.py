@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+import typing
+
+import asyncpg
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import SendMessage, SendPhoto, TelegramMethod
+from aiogram.types import Message
+
+from .outbox import Outbox, Priority
+from .static_loader import StaticLoader
+
+logger = logging.getLogger(__name__)
+
+# Следующая пачка известных чатов после $1 – и активных, и перенесённых в архив. Пагинация по ключу:
+# каждая пачка – короткий запрос по первичным ключам, который можно продолжить с любого места.
+_NEXT_CHATS = """
+select k.chat_id
+from (
+    select s.chat_id from bot.chat_state as s where s.chat_id > $1
+    union all
+    select a.chat_id from bot.chat_archive as a where a.chat_id > $1
+) as k
+order by k.chat_id
+limit $2
+"""
+
+_CREATE = "insert into bot.broadcast (text, file_code) values ($1, $2) returning id"
+
+_GET = "select b.* from bot.broadcast as b where b.id = $1"
+
+_SAVE_PROGRESS = """
+update bot.broadcast
+set last_chat_id = $2,
+    delivered    = delivered + $3,
+    failed       = failed + $4,
+    blocked      = blocked + $5
+where id = $1
+"""
+
+_FINISH = "update bot.broadcast set finished_at = current_timestamp where id = $1"
+
+_FIRST_CHAT_ID = -(2**63)
+
+# Сколько чатов пробовать для первой загрузки изображения, прежде чем отправлять пачку без file_id
+_UPLOAD_ATTEMPTS = 3
+
+
+class BroadcastStats:
+    """Итоги рассылки: счётчики за всё время и скорость отправки в текущем запуске."""
+
+    __slots__ = ("delivered", "failed", "blocked", "_sent", "_started")
+
+    def __init__(self, delivered: int = 0, failed: int = 0, blocked: int = 0) -> None:
+        self.delivered = delivered
+        self.failed = failed
+        self.blocked = blocked
+        self._sent = 0
+        self._started = time.monotonic()
+
+    @property
+    def sends_per_second(self) -> float:
+        elapsed = time.monotonic() - self._started
+        return self._sent / elapsed if elapsed > 0 else 0.0
+
+    def add(self, delivered: int, failed: int, blocked: int) -> None:
+        self.delivered += delivered
+        self.failed += failed
+        self.blocked += blocked
+        self._sent += delivered + failed + blocked
+
+    def __str__(self) -> str:
+        return (
+            f"доставлено {self.delivered}, ошибок {self.failed}, заблокировали бота {self.blocked},"
+            f" {self.sends_per_second:.1f} отправок/с"
+        )
+
+
+class Broadcaster:
+    """
+    Рассылка сообщения всем известным чатам.
+    Чаты читаются пачками по batch_size, сообщения пачки отправляются одновременно через Outbox с приоритетом
+    BULK: ограничения скорости Telegram соблюдает Outbox, а ответы пользователям уходят раньше рассылки.
+    После каждой пачки прогресс сохраняется в bot.broadcast, поэтому прерванная рассылка продолжается
+    с первой неотправленной пачки (сообщения прерванной пачки могут уйти повторно).
+    Изображение загружается в Telegram один раз, дальше отправляется его file_id. Если первая загрузка
+    не удалась, она повторяется следующим чатам пачки (до _UPLOAD_ATTEMPTS), и только потом пачка
+    отправляется целиком.
+    """
+
+    def __init__(
+        self,
+        pool: asyncpg.Pool,
+        outbox: Outbox,
+        static_loader: StaticLoader | None = None,
+        batch_size: int = 500,
+    ) -> None:
+        self._pool = pool
+        self._outbox = outbox
+        self._static_loader = static_loader
+        self._batch_size = batch_size
+
+    async def create(self, text: str, file_code: str | None = None) -> int:
+        """Создать рассылку текста (подписи к изображению с кодом file_code). Возвращает её идентификатор."""
+        assert file_code is None or self._static_loader is not None, "Для изображений требуется StaticLoader"
+        async with self._pool.acquire() as connection:
+            return await connection.fetchval(_CREATE, text, file_code)
+
+    async def run(self, broadcast_id: int) -> BroadcastStats:
+        """Выполнить рассылку или продолжить прерванную."""
+        async with self._pool.acquire() as connection:
+            broadcast = await connection.fetchrow(_GET, broadcast_id)
+        assert broadcast is not None, f"Рассылка {broadcast_id} не найдена"
+        stats = BroadcastStats(broadcast["delivered"], broadcast["failed"], broadcast["blocked"])
+        if broadcast["finished_at"] is not None:
+            return stats
+
+        text, file_code = broadcast["text"], broadcast["file_code"]
+        photo = await self._static_loader.get_file(file_code) if file_code is not None else None
+        last_chat_id = broadcast["last_chat_id"] if broadcast["last_chat_id"] is not None else _FIRST_CHAT_ID
+        while chat_ids := await self._next_chats(last_chat_id):
+            results: list[Message | BaseException] = []
+            chat_ids_left = chat_ids
+            if photo is not None and not isinstance(photo, str):
+                # Изображение загружается по одному чату, пока не получит file_id, чтобы остальным отправить его
+                for chat_id in chat_ids[:_UPLOAD_ATTEMPTS]:
+                    result = (await self._send_all([chat_id], text, photo))[0]
+                    results.append(result)
+                    chat_ids_left = chat_ids_left[1:]
+                    if isinstance(result, Message):
+                        await self._static_loader.remember_file_id(file_code, result)
+                        photo = await self._static_loader.get_file(file_code)
+                        break
+            results += await self._send_all(chat_ids_left, text, photo)
+
+            blocked = sum(isinstance(result, TelegramForbiddenError) for result in results)
+            failed = sum(isinstance(result, BaseException) for result in results) - blocked
+            delivered = len(results) - failed - blocked
+            last_chat_id = chat_ids[-1]
+            async with self._pool.acquire() as connection:
+                await connection.execute(_SAVE_PROGRESS, broadcast_id, last_chat_id, delivered, failed, blocked)
+            stats.add(delivered, failed, blocked)
+            logger.info("Рассылка %d: %s", broadcast_id, stats)
+
+        async with self._pool.acquire() as connection:
+            await connection.execute(_FINISH, broadcast_id)
+        return stats
+
+    async def _next_chats(self, after_chat_id: int) -> list[int]:
+        async with self._pool.acquire() as connection:
+            records = await connection.fetch(_NEXT_CHATS, after_chat_id, self._batch_size)
+        return [record["chat_id"] for record in records]
+
+    async def _send_all(
+        self, chat_ids: typing.Sequence[int], text: str, photo: typing.Any | None
+    ) -> list[Message | BaseException]:
+        methods: list[TelegramMethod[Message]] = [
+            SendPhoto(chat_id=chat_id, photo=photo, caption=text, parse_mode="html")
+            if photo is not None
+            else SendMessage(chat_id=chat_id, text=text, parse_mode="html")
+            for chat_id in chat_ids
+        ]
+        futures = [self._outbox.send(method.chat_id, method, Priority.BULK) for method in methods]
+        return await asyncio.gather(*futures, return_exceptions=True)
@@ -0,0 +1,88 @@
+import abc
+import json
+import typing
+from collections import UserDict
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - необязательная зависимость
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - необязательная зависимость
+    msgpack = None
+
+
+class ContextCodec(abc.ABC):
+    """Способ сериализации контекста чата для хранения."""
+
+    name: typing.ClassVar[str]
+
+    @abc.abstractmethod
+    def encode(self, value: typing.Any) -> bytes: ...
+
+    @abc.abstractmethod
+    def decode(self, data: bytes) -> dict[str, typing.Any]: ...
+
+
+class JsonCodec(ContextCodec):
+    """JSON. Использует orjson, если он установлен, иначе стандартный json без лишних пробелов."""
+
+    name = "json"
+
+    def encode(self, value: typing.Any) -> bytes:
+        if orjson is not None:
+            # Нестроковые ключи становятся строками, как в стандартном json
+            return orjson.dumps(_plain(value), option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(_plain(value), separators=(",", ":"), ensure_ascii=False).encode()
+
+    def decode(self, data: bytes | str) -> dict[str, typing.Any]:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+
+class MsgpackCodec(ContextCodec):
+    """MessagePack – компактный двоичный формат. Подходит для SQLite, но не для jsonb."""
+
+    name = "msgpack"
+
+    def __init__(self) -> None:
+        assert msgpack is not None, "Для MsgpackCodec требуется пакет msgpack"
+
+    def encode(self, value: typing.Any) -> bytes:
+        return msgpack.packb(_plain(value))
+
+    def decode(self, data: bytes) -> dict[str, typing.Any]:
+        return msgpack.unpackb(data)
+
+
+CODECS: dict[str, type[ContextCodec]] = {JsonCodec.name: JsonCodec, MsgpackCodec.name: MsgpackCodec}
+
+_JSON = JsonCodec()
+
+
+def get_codec(name: str) -> ContextCodec:
+    """Получить кодек по имени."""
+    return CODECS[name]()
+
+
+def detect_codec(data: bytes | str) -> ContextCodec:
+    """
+    Определить кодек, которым записан контекст: JSON-объект начинается с «{»,
+    а словарь MessagePack – с байта 0x80–0x8f, 0xde или 0xdf.
+    """
+    if isinstance(data, str) or data[:1] == b"{":
+        return _JSON
+    return MsgpackCodec()
+
+
+def decode_any(data: bytes | str) -> dict[str, typing.Any]:
+    """Декодировать контекст, записанный любым из кодеков (для чтения строк до смены кодека)."""
+    return detect_codec(data).decode(data)
+
+
+def _plain(value: typing.Any) -> typing.Any:
+    """Context и другие UserDict сериализуются как обычный словарь."""
+    return value.data if isinstance(value, UserDict) else value
@@ -1,16 +1,97 @@
-import json
 import typing
+from pathlib import Path
 
 import asyncpg
-from databases import Database
 
+from src.lib.codecs import JsonCodec
+from src.lib.metrics import Gauge
 
-async def asyncpg_init(connection: asyncpg.Connection) -> None:
-    await connection.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
-    await connection.set_type_codec("json", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+if typing.TYPE_CHECKING:
+    from src.lib.state_machine import StateMachineStorage
+    from src.lib.state_machine.storages import (
+        AsyncpgStateMachineStorage,
+        AsyncSQLiteStorage,
+        BufferedPGStateMachineStorage,
+        CachedStorage,
+    )
 
+# Версия двоичного представления jsonb в протоколе PostgreSQL: за ней следует текст документа.
+_JSONB_FORMAT_VERSION = b"\x01"
 
-async def database_pool(url: str, **kwargs) -> typing.AsyncGenerator[Database, None]:
-    """Получить пул соединений к базе данных."""
-    async with Database(url, init=asyncpg_init, **kwargs) as db:
-        yield db
+
+async def asyncpg_init(connection: asyncpg.Connection, codec: JsonCodec = JsonCodec()) -> None:
+    """
+    Кодеки json и jsonb в двоичном формате протокола: документ передаётся байтами без
+    промежуточной строки, а с orjson и сериализуется быстрее стандартного json.
+    """
+    await connection.set_type_codec(
+        "jsonb",
+        encoder=lambda value: _JSONB_FORMAT_VERSION + codec.encode(value),
+        decoder=lambda data: codec.decode(data[1:]),
+        schema="pg_catalog",
+        format="binary",
+    )
+    await connection.set_type_codec(
+        "json",
+        encoder=codec.encode,
+        decoder=codec.decode,
+        schema="pg_catalog",
+        format="binary",
+    )
+
+
+async def asyncpg_pool(dsn: str, min_size: int, max_size: int, **kwargs) -> typing.AsyncGenerator[asyncpg.Pool, None]:
+    """Получить пул соединений asyncpg – единственный пул процесса: хранилище, StaticLoader, архивация."""
+    async with asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size, init=asyncpg_init, **kwargs) as pool:
+        yield pool
+
+
+def asyncpg_storage(pool: asyncpg.Pool, **kwargs) -> "AsyncpgStateMachineStorage":
+    """AsyncpgStateMachineStorage; модуль хранилища импортируется только при выборе этого хранилища."""
+    from src.lib.state_machine.storages import AsyncpgStateMachineStorage
+
+    return AsyncpgStateMachineStorage(pool, **kwargs)
+
+
+def cached_storage(storage: "StateMachineStorage", **kwargs) -> "CachedStorage":
+    """CachedStorage поверх storage; модуль кеша импортируется только при включённом кеше."""
+    from src.lib.state_machine.storages import CachedStorage
+
+    return CachedStorage(storage, **kwargs)
+
+
+async def buffered_pg_storage(
+    pool: asyncpg.Pool, **kwargs
+) -> typing.AsyncGenerator["BufferedPGStateMachineStorage", None]:
+    """BufferedPGStateMachineStorage, сбрасывающее накопленные записи при закрытии ресурсов контейнера."""
+    from src.lib.state_machine.storages import BufferedPGStateMachineStorage
+
+    storage = BufferedPGStateMachineStorage(pool, **kwargs)
+    try:
+        yield storage
+    finally:
+        await storage.close()
+
+
+async def async_sqlite_storage(db_path: Path, **kwargs) -> typing.AsyncGenerator["AsyncSQLiteStorage", None]:
+    """AsyncSQLiteStorage, фиксирующее транзакцию и закрывающее файл при закрытии ресурсов контейнера."""
+    from src.lib.state_machine.storages import AsyncSQLiteStorage
+
+    storage = AsyncSQLiteStorage(str(db_path), **kwargs)
+    try:
+        yield storage
+    finally:
+        await storage.close()
+
+
+def pool_usage_gauge(pool: asyncpg.Pool) -> Gauge:
+    """Показатель использования пула соединений: размер пула и занятые соединения."""
+
+    def collect() -> dict[tuple[str, ...], float]:
+        return {
+            ("size",): pool.get_size(),
+            ("busy",): pool.get_size() - pool.get_idle_size(),
+            ("max",): pool.get_max_size(),
+        }
+
+    return Gauge("bot_db_pool_connections", "Соединения пула базы данных", ["kind"], callback=collect)
@@ -0,0 +1,35 @@
+import asyncio
+import typing
+from contextlib import asynccontextmanager
+
+Key = typing.TypeVar("Key", bound=typing.Hashable)
+
+
+class KeyedLock(typing.Generic[Key]):
+    """
+    Набор блокировок по ключу. Ожидающие захватывают блокировку в порядке поступления.
+    Блокировка удаляется, как только её никто не держит и не ждёт, поэтому память
+    занимают только активные ключи.
+    """
+
+    def __init__(self) -> None:
+        self._locks: dict[Key, asyncio.Lock] = {}
+        self._users: dict[Key, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def __call__(self, key: Key) -> typing.AsyncGenerator[None, None]:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if self._users[key] == 0:
+                del self._users[key]
+                del self._locks[key]
@@ -0,0 +1,166 @@
+import abc
+import bisect
+import time
+import typing
+from contextlib import contextmanager
+
+from aiohttp import web
+
+LabelValues: typing.TypeAlias = tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric(abc.ABC):
+    """Метрика в формате Prometheus с набором меток."""
+
+    type: typing.ClassVar[str]
+
+    def __init__(self, name: str, documentation: str, labels: typing.Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    @abc.abstractmethod
+    def samples(self) -> typing.Iterator[tuple[str, LabelValues, float]]:
+        """Отсчёты: (суффикс имени, значения меток, значение)."""
+        ...
+
+    def render(self) -> typing.Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for suffix, label_values, value in self.samples():
+            yield f"{self.name}{suffix}{self._format_labels(label_values)} {value}"
+
+    def _format_labels(self, label_values: LabelValues) -> str:
+        if not label_values:
+            return ""
+        pairs = zip(self.label_names + ("le",), label_values)
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: typing.Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> typing.Iterator[tuple[str, LabelValues, float]]:
+        for label_values, value in self._values.items():
+            yield "_total", label_values, value
+
+
+class Gauge(Metric):
+    """Показатель. Значение задаётся явно или вычисляется функцией callback при каждом сборе."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: typing.Sequence[str] = (),
+        callback: typing.Callable[[], typing.Mapping[LabelValues, float]] | None = None,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def samples(self) -> typing.Iterator[tuple[str, LabelValues, float]]:
+        values = self._callback() if self._callback is not None else self._values
+        for label_values, value in values.items():
+            yield "", label_values, value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: typing.Sequence[str] = (),
+        buckets: typing.Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self._buckets = tuple(buckets)
+        self._counts: dict[LabelValues, list[int]] = {}  # последний элемент – +Inf
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        counts = self._counts.get(label_values)
+        if counts is None:
+            counts = self._counts[label_values] = [0] * (len(self._buckets) + 1)
+            self._sums[label_values] = 0.0
+        counts[bisect.bisect_left(self._buckets, value)] += 1
+        self._sums[label_values] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> typing.Iterator[None]:
+        """Измерить длительность блока в секундах."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self) -> typing.Iterator[tuple[str, LabelValues, float]]:
+        for label_values, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip((*self._buckets, float("inf")), counts):
+                cumulative += count
+                yield "_bucket", (*label_values, "+Inf" if bound == float("inf") else str(bound)), cumulative
+            yield "_sum", label_values, self._sums[label_values]
+            yield "_count", label_values, cumulative
+
+
+class Registry:
+    """Набор метрик, отдаваемых одним HTTP-обработчиком."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        assert metric.name not in self._metrics, f"Метрика «{metric.name}» уже зарегистрирована"
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics.values() for line in metric.render()) + "\n"
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+
+async def serve_metrics(
+    registry: Registry,
+    host: str,
+    port: int,
+    ready_handler: typing.Callable[[web.Request], typing.Awaitable[web.Response]] | None = None,
+) -> web.AppRunner:
+    """Запустить HTTP-сервер с метриками по адресу /metrics и, если передан ready_handler, пробой /ready."""
+    app = web.Application()
+    app.router.add_get("/metrics", registry.handle)
+    if ready_handler is not None:
+        app.router.add_get("/ready", ready_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
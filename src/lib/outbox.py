@@ -0,0 +1,286 @@
+import asyncio
+import contextlib
+import contextvars
+import enum
+import heapq
+import itertools
+import logging
+import time
+import typing
+from collections import deque
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+T = typing.TypeVar("T")
+
+# Ограничение Telegram на отправку сообщений одним ботом, сообщений в секунду. Его делят все очереди бота:
+# процессы-обработчики и рассылка (python -m src.broadcast).
+TELEGRAM_GLOBAL_RATE = 30
+
+
+class Priority(enum.IntEnum):
+    """Приоритет исходящего сообщения. Меньшее значение отправляется раньше."""
+
+    REPLY = 0
+    BULK = 10
+
+
+class TokenBucket:
+    """Ведро токенов: не более rate отправок в секунду с пиком до capacity."""
+
+    __slots__ = ("_rate", "_capacity", "_tokens", "_updated_at")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд появится токен."""
+        self._refill(now)
+        return max(0.0, (1 - self._tokens) / self._rate)
+
+    def take(self) -> None:
+        """Забрать токен (после того как wait_time вернул 0)."""
+        self._tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self._tokens >= self._capacity
+
+
+class _Item:
+    __slots__ = ("method", "priority", "future")
+
+    def __init__(self, method: TelegramMethod, priority: Priority, future: asyncio.Future) -> None:
+        self.method = method
+        self.priority = priority
+        self.future = future
+
+
+class _Buffer:
+    """Методы, накопленные Outbox.buffer. После выхода из буфера новые методы в него не попадают."""
+
+    __slots__ = ("items", "is_open")
+
+    def __init__(self) -> None:
+        self.items: list[tuple[int, _Item]] = []
+        self.is_open = True
+
+
+class _Chat:
+    """Очередь сообщений одного чата. Сообщения чата отправляются строго по порядку и по одному."""
+
+    __slots__ = ("items", "bucket", "scheduled")
+
+    def __init__(self, bucket: TokenBucket) -> None:
+        self.items: deque[_Item] = deque()
+        self.bucket = bucket
+        self.scheduled = False  # в очереди готовых, ожидает токена или отправляется
+
+
+class Outbox:
+    """
+    Очередь исходящих сообщений с учётом ограничений Telegram.
+    Соблюдает общий лимит отправок и лимит на чат, выдерживает паузу retry_after при TelegramRetryAfter
+    и отправляет ответы пользователям раньше массовых рассылок. Постановка в очередь не блокирует:
+    send возвращает future с результатом метода, ждать которую не обязательно.
+    Внутри buffer методы копятся и ставятся в очереди чатов только при выходе из него.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+    ) -> None:
+        self._bot = bot
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats: dict[int, _Chat] = {}
+        self._ready: list[tuple[Priority, int, int]] = []  # куча (приоритет, порядковый номер, чат)
+        self._ready_event = asyncio.Event()
+        self._counter = itertools.count()
+        self._paused_until = 0.0
+        self._dispatcher: asyncio.Task | None = None
+        self._sending: set[asyncio.Task] = set()
+        self._buffer: contextvars.ContextVar[_Buffer | None] = contextvars.ContextVar("outbox_buffer", default=None)
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def queue_depth(self) -> dict[Priority, int]:
+        """Количество ожидающих отправки сообщений по приоритетам."""
+        depth = dict.fromkeys(Priority, 0)
+        for chat in self._chats.values():
+            for item in chat.items:
+                depth[item.priority] += 1
+        return depth
+
+    def send(self, chat_id: int, method: TelegramMethod[T], priority: Priority = Priority.REPLY) -> asyncio.Future[T]:
+        """Поставить метод Bot API в очередь чата chat_id."""
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_log_failure)
+        item = _Item(method, priority, future)
+        if (buffer := self._buffer.get()) is not None and buffer.is_open:
+            buffer.items.append((chat_id, item))
+        else:
+            self._enqueue(chat_id, item)
+        return future
+
+    def send_message(
+        self, chat_id: int, text: str, priority: Priority = Priority.REPLY, **kwargs
+    ) -> asyncio.Future[Message]:
+        """Поставить в очередь отправку текстового сообщения."""
+        return self.send(chat_id, SendMessage(chat_id=chat_id, text=text, **kwargs), priority)
+
+    def send_now(self, method: TelegramMethod[T]) -> asyncio.Future[T]:
+        """
+        Выполнить метод Bot API сразу, минуя буфер, очереди и лимиты чатов.
+        Для ответов, которые не являются сообщениями чата, например answerCallbackQuery.
+        """
+        task = asyncio.ensure_future(self._bot(method))
+        task.add_done_callback(_log_failure)
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+        return task
+
+    @contextlib.contextmanager
+    def buffer(self) -> typing.Iterator[None]:
+        """
+        Копить методы, отправляемые в текущем контексте, и поставить их в очереди по порядку при выходе.
+        Если блок завершился исключением, накопленные методы не отправляются, а их future отменяются.
+        """
+        buffer = _Buffer()
+        token = self._buffer.set(buffer)
+        try:
+            yield
+        except BaseException:
+            for _, item in buffer.items:
+                item.future.cancel()
+            raise
+        finally:
+            buffer.is_open = False
+            self._buffer.reset(token)
+        for chat_id, item in buffer.items:
+            self._enqueue(chat_id, item)
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """
+        Остановить очередь. Ожидающие сообщения отправляются ещё не дольше timeout секунд,
+        future неотправленных за это время отменяются, чтобы их ожидание не зависло.
+        """
+        deadline = time.monotonic() + timeout
+        while self._dispatcher is not None and any(chat.items for chat in self._chats.values()):
+            if time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.05)
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        await asyncio.gather(*self._sending, return_exceptions=True)
+
+        dropped = 0
+        for chat in self._chats.values():
+            for item in chat.items:
+                dropped += not item.future.done()
+                item.future.cancel()
+        self._chats.clear()
+        self._ready.clear()
+        if dropped:
+            logger.warning("Очередь остановлена, не отправлено сообщений: %d", dropped)
+
+    def _enqueue(self, chat_id: int, item: _Item) -> None:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(TokenBucket(self._chat_rate, self._chat_burst))
+        chat.items.append(item)
+        if not chat.scheduled:
+            self._make_ready(chat_id, chat)
+
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def _make_ready(self, chat_id: int, chat: _Chat) -> None:
+        chat.scheduled = True
+        heapq.heappush(self._ready, (chat.items[0].priority, next(self._counter), chat_id))
+        self._ready_event.set()
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._ready:
+                self._ready_event.clear()
+                await self._ready_event.wait()
+                continue
+            _, _, chat_id = heapq.heappop(self._ready)
+            chat = self._chats[chat_id]
+
+            now = time.monotonic()
+            if (chat_wait := chat.bucket.wait_time(now)) > 0:
+                loop.call_later(chat_wait, self._make_ready, chat_id, chat)
+                continue
+            if (global_wait := max(self._global_bucket.wait_time(now), self._paused_until - now)) > 0:
+                heapq.heappush(self._ready, (chat.items[0].priority, next(self._counter), chat_id))
+                await asyncio.sleep(global_wait)
+                continue
+
+            chat.bucket.take()
+            self._global_bucket.take()
+            task = asyncio.create_task(self._deliver(chat_id, chat))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, chat_id: int, chat: _Chat) -> None:
+        item = chat.items[0]
+        try:
+            result = await self._bot(item.method)
+        except TelegramRetryAfter as error:
+            self.retried += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + error.retry_after)
+            logger.warning("Превышен лимит Telegram, отправка приостановлена на %d с", error.retry_after)
+        except Exception as error:
+            self.failed += 1
+            chat.items.popleft()
+            item.future.set_exception(error)
+        else:
+            self.sent += 1
+            chat.items.popleft()
+            item.future.set_result(result)
+
+        if chat.items:
+            self._make_ready(chat_id, chat)
+        else:
+            chat.scheduled = False
+            if chat.bucket.is_full(time.monotonic()):
+                del self._chats[chat_id]
+            else:
+                asyncio.get_running_loop().call_later(self._chat_burst / self._chat_rate, self._evict, chat_id)
+
+    def _evict(self, chat_id: int) -> None:
+        """Удалить простаивающий чат, лимит которого уже восстановился."""
+        chat = self._chats.get(chat_id)
+        if chat is None or chat.scheduled:
+            return
+        if chat.bucket.is_full(time.monotonic()):
+            del self._chats[chat_id]
+        else:
+            asyncio.get_running_loop().call_later(1 / self._chat_rate, self._evict, chat_id)
+
+
+def _log_failure(future: asyncio.Future) -> None:
+    if not future.cancelled() and (error := future.exception()) is not None:
+        logger.error("Не удалось отправить сообщение: %s", error)
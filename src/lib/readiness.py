@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from aiohttp import web
+
+
+class Readiness:
+    """
+    Признак готовности процесса принимать обновления – для проб оркестратора при развёртывании.
+    Готовность видна по файлу file (если задан) и по ответу 200 на GET /ready (503, пока процесс не готов).
+    """
+
+    def __init__(self, file: Path | None = None) -> None:
+        self._file = file
+        self._ready = False
+        if file is not None:
+            file.unlink(missing_ok=True)  # файл мог остаться от предыдущего запуска
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready
+
+    def set(self) -> None:
+        """Отметить процесс готовым."""
+        self._ready = True
+        if self._file is not None:
+            self._file.touch()
+
+    def clear(self) -> None:
+        """Снять отметку готовности, например при остановке."""
+        self._ready = False
+        if self._file is not None:
+            self._file.unlink(missing_ok=True)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self._ready:
+            return web.Response(text="ready")
+        return web.Response(status=503, text="starting")
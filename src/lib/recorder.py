@@ -0,0 +1,145 @@
+import asyncio
+import datetime
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+import typing
+from pathlib import Path
+
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+from .state_machine import State
+
+logger = logging.getLogger(__name__)
+
+Handler: typing.TypeAlias = typing.Callable[[TelegramObject, dict[str, typing.Any]], typing.Awaitable[typing.Any]]
+
+
+class TrafficRecorder:
+    """
+    Запись входящих сообщений и обратных вызовов для воспроизведения (benchmarks/replay.py).
+
+    Подключается к диспетчеру как внешний middleware обновлений и пишет в directory сжатые gzip строки JSON:
+    {"t": время получения, "update": обновление}. Записываются только поля, нужные StateMachine, в обезличенном
+    виде: идентификаторы пользователей заменяются HMAC с солью salt (один пользователь – один идентификатор
+    в пределах записи), имена не сохраняются, а текст, кроме текстов из keep_texts (кнопок) и названий команд,
+    маскируется с сохранением длины: буквы заменяются на «x», цифры – на «0».
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        salt: str | None = None,
+        keep_texts: typing.Collection[str] = (),
+        flush_interval: float = 1.0,
+    ) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        started = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.path = directory / f"capture-{started}-{os.getpid()}.jsonl.gz"
+        self._salt = (salt or secrets.token_hex(16)).encode()  # без соли идентификаторы нельзя восстановить
+        self._keep_texts = frozenset(keep_texts)
+        self._flush_interval = flush_interval
+        self._file = gzip.open(self.path, "ab")
+        self._pending: list[bytes] = []
+        self._flush_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._closed = asyncio.Event()
+        self.recorded = 0
+
+    async def middleware(self, handler: Handler, event: TelegramObject, data: dict[str, typing.Any]) -> typing.Any:
+        if isinstance(event, Update) and (record := self._anonymize(event)) is not None:
+            line = json.dumps({"t": time.time(), "update": record}, ensure_ascii=False, separators=(",", ":"))
+            self._pending.append(line.encode() + b"\n")
+            self.recorded += 1
+            if self._flusher is None and not self._closed.is_set():
+                self._flusher = asyncio.create_task(self._flush_periodically())
+        return await handler(event, data)
+
+    async def flush(self) -> None:
+        """Записать накопленные обновления в файл."""
+        async with self._flush_lock:
+            lines, self._pending = self._pending, []
+            if lines:
+                await asyncio.to_thread(self._write, lines)
+
+    async def close(self) -> None:
+        """
+        Остановить фоновую запись, дописать накопленные обновления и закрыть файл.
+        Фоновая запись не отменяется, а завершается после текущей: поток, пишущий в файл, отменить нельзя.
+        """
+        self._closed.set()
+        if self._flusher is not None:
+            await asyncio.wait([self._flusher])
+        await self.flush()
+        await asyncio.to_thread(self._file.close)
+        logger.info("Записано обновлений: %d в %s", self.recorded, self.path)
+
+    async def _flush_periodically(self) -> None:
+        while not self._closed.is_set():
+            try:
+                await asyncio.wait_for(self._closed.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось записать обновления в %s", self.path)
+
+    def _write(self, lines: list[bytes]) -> None:
+        self._file.writelines(lines)
+        self._file.flush()
+
+    def _anonymize(self, update: Update) -> dict[str, typing.Any] | None:
+        if (message := update.message) is not None and message.from_user is not None:
+            return {"update_id": update.update_id, "message": self._message(message)}
+        if (query := update.callback_query) is not None:
+            return {"update_id": update.update_id, "callback_query": self._callback_query(query)}
+        return None
+
+    def _message(self, message: Message) -> dict[str, typing.Any]:
+        record = {
+            "message_id": message.message_id,
+            "date": int(message.date.timestamp()),
+            "chat": {"id": self._anonymous_id(message.chat.id), "type": message.chat.type},
+            "from": {"id": self._anonymous_id(message.from_user.id), "is_bot": False, "first_name": "user"},
+        }
+        if message.text is not None:
+            record["text"] = self._text(message.text)
+        return record
+
+    def _callback_query(self, query: CallbackQuery) -> dict[str, typing.Any]:
+        user_id = self._anonymous_id(query.from_user.id)
+        record = {
+            "id": str(user_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+            "chat_instance": str(user_id),
+        }
+        if query.data is not None:
+            record["data"] = query.data  # данные задаёт сам бот
+        return record
+
+    def _anonymous_id(self, real_id: int) -> int:
+        digest = hmac.new(self._salt, str(real_id).encode(), hashlib.sha256).digest()
+        return int.from_bytes(digest[:6], "big") + 1  # 48 бит: положительный и допустимый в JSON без потерь
+
+    def _text(self, text: str) -> str:
+        if text in self._keep_texts:
+            return text
+        if text.startswith("/"):
+            command, separator, arguments = text.partition(" ")
+            return command + separator + _mask(arguments)
+        return _mask(text)
+
+
+def _mask(text: str) -> str:
+    return "".join("0" if char.isdigit() else "x" if char.isalpha() else char for char in text)
+
+
+def route_texts(states: typing.Iterable[State], extra: typing.Iterable[str] = ()) -> set[str]:
+    """Тексты кнопок из static_routes состояний и extra – их можно записывать без маскирования."""
+    return {text for state in states for text in state.static_routes} | set(extra)
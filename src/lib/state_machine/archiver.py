@@ -0,0 +1,132 @@
+import asyncio
+import datetime
+import logging
+
+import asyncpg
+
+from ..metrics import Counter, Gauge, Registry
+
+logger = logging.getLogger(__name__)
+
+# Перенести в архив до $2 чатов, в которых не было действий дольше $1. Граница считается в базе, по тем же
+# часам и часовому поясу сеанса, которыми записан seen_at.
+# Кандидаты выбираются по индексу chat_state_seen_at. Чаты, действие которых сейчас обрабатывается, пропускаются:
+# обработчик держит advisory-блокировку чата до конца транзакции действия (хранилище с advisory_lock=True),
+# а чат, чья блокировка занята, сюда не попадает. Действие, начавшееся во время архивации, ждёт блокировку
+# и после неё найдёт чат уже в архиве.
+_ARCHIVE_IDLE = """
+with idle as (
+    select s.chat_id
+    from bot.chat_state as s
+    where s.seen_at < current_timestamp - $1::interval
+      and pg_try_advisory_xact_lock(s.chat_id)
+    order by s.seen_at
+    limit $2
+    for update of s skip locked
+),
+moved_state as (
+    delete from bot.chat_state as s using idle
+    where s.chat_id = idle.chat_id
+    returning s.chat_id, s.state_code, s.seen_at
+),
+moved_context as (
+    delete from bot.chat_context as c using idle
+    where c.chat_id = idle.chat_id
+    returning c.chat_id, c.context
+)
+insert into bot.chat_archive (chat_id, state_code, context, last_active_at)
+select s.chat_id, s.state_code, c.context, s.seen_at
+from moved_state as s
+    left join moved_context as c on c.chat_id = s.chat_id
+on conflict (chat_id) do update
+set state_code     = excluded.state_code,
+    context        = excluded.context,
+    last_active_at = excluded.last_active_at,
+    archived_at    = current_timestamp
+"""
+
+_TABLE_STATS = """
+select t.relname as table_name,
+       pg_total_relation_size(t.relid) as size_bytes,
+       t.n_live_tup as live_tuples,
+       t.n_dead_tup as dead_tuples
+from pg_stat_user_tables as t
+where t.schemaname = 'bot'
+"""
+
+
+class ChatArchiver:
+    """
+    Фоновое обслуживание таблиц чатов: чаты, в которых не было действий дольше idle_after (по seen_at,
+    с точностью до суток), переносятся в bot.chat_archive, чтобы chat_state и chat_context не росли бесконечно.
+    Чат возвращается из архива при следующем действии (StateMachineStorage.restore_archived).
+    Хранилище бота должно брать advisory-блокировку чата на время действия (workers.advisory_locks),
+    иначе чат может уйти в архив посреди действия.
+    Заодно собираются размеры таблиц схемы bot и количество мёртвых строк.
+    """
+
+    def __init__(
+        self,
+        pool: asyncpg.Pool,
+        idle_after: datetime.timedelta,
+        interval: float = 3600,
+        batch_size: int = 1000,
+    ) -> None:
+        self._pool = pool
+        self._idle_after = idle_after
+        self._interval = interval
+        self._batch_size = batch_size
+        self._table_stats: dict[str, asyncpg.Record] = {}
+        self.archived = Counter("bot_chats_archived", "Чаты, перенесённые в архив после долгого бездействия")
+
+    async def run(self) -> None:
+        """Обслуживать таблицы каждые interval секунд, пока задача не будет отменена."""
+        while True:
+            try:
+                archived = await self.archive_idle()
+                await self.refresh_table_stats()
+                if archived:
+                    logger.info("Перенесено в архив чатов: %d", archived)
+            except Exception:
+                logger.exception("Не удалось обслужить таблицы чатов")
+            await asyncio.sleep(self._interval)
+
+    async def archive_idle(self) -> int:
+        """Перенести в архив все бездействующие чаты, пачками по batch_size. Возвращает количество чатов."""
+        total = 0
+        while True:
+            async with self._pool.acquire() as connection:
+                status = await connection.execute(_ARCHIVE_IDLE, self._idle_after, self._batch_size)
+            archived = int(status.rsplit(" ", 1)[-1])  # «INSERT 0 n»
+            total += archived
+            self.archived.inc(amount=archived)
+            if archived < self._batch_size:
+                return total
+
+    async def refresh_table_stats(self) -> None:
+        async with self._pool.acquire() as connection:
+            records = await connection.fetch(_TABLE_STATS)
+        self._table_stats = {record["table_name"]: record for record in records}
+
+    def register_metrics(self, registry: Registry) -> None:
+        registry.register(self.archived)
+        registry.register(
+            Gauge(
+                "bot_table_size_bytes",
+                "Размер таблицы схемы bot вместе с индексами",
+                ["table"],
+                callback=lambda: {(name,): record["size_bytes"] for name, record in self._table_stats.items()},
+            )
+        )
+        registry.register(
+            Gauge(
+                "bot_table_tuples",
+                "Живые и мёртвые строки таблицы схемы bot по статистике PostgreSQL",
+                ["table", "kind"],
+                callback=lambda: {
+                    (name, kind): record[f"{kind}_tuples"]
+                    for name, record in self._table_stats.items()
+                    for kind in ("live", "dead")
+                },
+            )
+        )
@@ -0,0 +1,71 @@
+import typing
+from contextlib import contextmanager
+
+from ..metrics import Counter, Gauge, Histogram, Registry
+from .state_machine import ChatId, Context, StateCode
+from .storages.base import ChatSnapshot, StateMachineStorage
+
+
+class StateMachineMetrics:
+    """Метрики обработки действий: длительность обработчиков состояний, переходы и вызовы хранилища."""
+
+    def __init__(self, registry: Registry) -> None:
+        self.actions_in_flight = registry.register(Gauge("bot_actions_in_flight", "Обрабатываемые сейчас действия"))
+        self.action_duration = registry.register(
+            Histogram("bot_action_duration_seconds", "Длительность обработки действия")
+        )
+        self.hook_duration = registry.register(
+            Histogram("bot_state_hook_duration_seconds", "Длительность обработчика состояния", ["hook", "state"])
+        )
+        self.state_switches = registry.register(Counter("bot_state_switches", "Переходы в состояние", ["state"]))
+        self.storage_duration = registry.register(
+            Histogram("bot_storage_call_duration_seconds", "Длительность вызова хранилища", ["method"])
+        )
+
+    @contextmanager
+    def track_action(self) -> typing.Iterator[None]:
+        self.actions_in_flight.inc()
+        try:
+            with self.action_duration.time():
+                yield
+        finally:
+            self.actions_in_flight.dec()
+
+
+class InstrumentedStorage(StateMachineStorage):
+    """Обёртка хранилища, измеряющая длительность каждого вызова."""
+
+    def __init__(self, storage: StateMachineStorage, metrics: StateMachineMetrics) -> None:
+        self._storage = storage
+        self._duration = metrics.storage_duration
+
+    async def get_state(self, chat_id: ChatId) -> StateCode | None:
+        with self._duration.time("get_state"):
+            return await self._storage.get_state(chat_id)
+
+    async def set_state(self, chat_id: ChatId, state_name: str) -> None:
+        with self._duration.time("set_state"):
+            await self._storage.set_state(chat_id, state_name)
+
+    async def get_context(self, chat_id: ChatId) -> Context | None:
+        with self._duration.time("get_context"):
+            return await self._storage.get_context(chat_id)
+
+    async def set_context(self, chat_id: ChatId, context: Context) -> None:
+        with self._duration.time("set_context"):
+            await self._storage.set_context(chat_id, context)
+
+    async def get_snapshot(self, chat_id: ChatId) -> ChatSnapshot:
+        with self._duration.time("get_snapshot"):
+            return await self._storage.get_snapshot(chat_id)
+
+    async def set_snapshot(self, chat_id: ChatId, snapshot: ChatSnapshot) -> None:
+        with self._duration.time("set_snapshot"):
+            await self._storage.set_snapshot(chat_id, snapshot)
+
+    async def restore_archived(self, chat_id: ChatId) -> ChatSnapshot | None:
+        with self._duration.time("restore_archived"):
+            return await self._storage.restore_archived(chat_id)
+
+    def lock(self, chat_id: ChatId) -> typing.AsyncContextManager[None]:
+        return self._storage.lock(chat_id)
@@ -1,29 +1,83 @@
+import asyncio
+import time
 import typing
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 
-from aiogram import Bot
 from aiogram.types import Message, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from dependency_injector.wiring import inject, Provide
 
+from ..outbox import Outbox
 from .state_machine import StateCode, Action, Context, ChatId
 
+if typing.TYPE_CHECKING:
+    from ..static_loader import StaticLoader
+
 
 Keyboard: typing.TypeAlias = ReplyKeyboardMarkup | ReplyKeyboardRemove
 
 
+_MISSING = object()
+
+
 class RenderedViewOnEnter(ABC):
+    """
+    Отправляет представление (текст и клавиатуру) при входе в состояние.
+    Если атрибут view_dependencies перечисляет ключи контекста, от которых зависит представление
+    (и только от них, не от chat_id), отрисованное представление кешируется по значениям этих ключей:
+    не больше view_cache_size вариантов, каждый не дольше view_cache_ttl секунд.
+    """
+
+    view_dependencies: typing.Collection[str] | None = None  # None – представление не кешируется
+    view_cache_size: int = 128
+    view_cache_ttl: float | None = 300  # тексты StaticLoader могут измениться, None – хранить бессрочно
+
+    _view_cache: OrderedDict[tuple, tuple[float, str, Keyboard]] | None = None
+
     @abstractmethod
     async def render_text(self, chat_id: ChatId, context: Context) -> str: ...
 
     @abstractmethod
     async def render_keyboard(self, chat_id: ChatId, context: Context) -> Keyboard: ...
 
+    @typing.final
+    async def render_view(self, chat_id: ChatId, context: Context) -> tuple[str, Keyboard]:
+        """Текст и клавиатура представления, из кеша или отрисованные одновременно."""
+        if self.view_dependencies is None:
+            return await self._render_view(chat_id, context)
+
+        # context.data, а не context[key]: чтение изменяемого значения по ключу помечает его изменённым
+        key = tuple(_freeze(context.data.get(name, _MISSING)) for name in self.view_dependencies)
+        if self._view_cache is None:
+            self._view_cache = OrderedDict()
+        cached = self._view_cache.get(key)
+        if cached is not None and (self.view_cache_ttl is None or time.monotonic() - cached[0] < self.view_cache_ttl):
+            self._view_cache.move_to_end(key)
+            return cached[1], cached[2]
+
+        text, keyboard = await self._render_view(chat_id, context)
+        self._view_cache[key] = (time.monotonic(), text, keyboard)
+        self._view_cache.move_to_end(key)
+        while len(self._view_cache) > self.view_cache_size:
+            self._view_cache.popitem(last=False)
+        return text, keyboard
+
+    def clear_view_cache(self) -> None:
+        """Сбросить закешированные представления, например после изменения текстов."""
+        self._view_cache = None
+
     @inject
     @typing.final
-    async def send_view(self, chat_id: ChatId, context: Context, bot: Bot = Provide["bot.client"]) -> None:
-        text = await self.render_text(chat_id, context)
-        keyboard = await self.render_keyboard(chat_id, context)
-        await bot.send_message(chat_id, text, reply_markup=keyboard, parse_mode="html")
+    async def send_view(self, chat_id: ChatId, context: Context, outbox: Outbox = Provide["bot.outbox"]) -> None:
+        text, keyboard = await self.render_view(chat_id, context)
+        outbox.send_message(chat_id, text, reply_markup=keyboard, parse_mode="html")
+
+    async def _render_view(self, chat_id: ChatId, context: Context) -> tuple[str, Keyboard]:
+        text, keyboard = await asyncio.gather(
+            self.render_text(chat_id, context),
+            self.render_keyboard(chat_id, context),
+        )
+        return text, keyboard
 
     async def on_enter(self, chat_id: ChatId, context: Context) -> None:
         await self.send_view(chat_id, context)
@@ -46,6 +100,33 @@ class StaticViewOnEnter(RenderedViewOnEnter, ABC):
     async def render_keyboard(self, chat_id: ChatId, context: Context) -> Keyboard:
         return self.keyboard
 
+    async def _render_view(self, chat_id: ChatId, context: Context) -> tuple[str, Keyboard]:
+        # Отрисовка не ждёт ввода-вывода, одновременный запуск только добавил бы задачи в цикл событий.
+        return self.text, self.keyboard
+
+
+class StaticImageOnEnter(ABC):
+    """
+    Отправляет изображение из статики с кодом image_code при входе в состояние.
+    Изображение загружается в Telegram один раз, дальше отправляется его file_id (см. StaticLoader.send_photo).
+    """
+
+    caption: str | None = None
+
+    @property
+    @abstractmethod
+    def image_code(self) -> str: ...
+
+    @inject
+    async def on_enter(
+        self,
+        chat_id: ChatId,
+        context: Context,
+        outbox: Outbox = Provide["bot.outbox"],
+        static_loader: "StaticLoader" = Provide["static_loader"],
+    ) -> None:
+        await static_loader.send_photo(outbox, chat_id, self.image_code, caption=self.caption)
+
 
 ValidatorReturnType = typing.TypeVar("ValidatorReturnType")
 
@@ -63,9 +144,9 @@ class ValidateOnMessage(typing.Generic[ValidatorReturnType], ABC):
         message: Message,
         chat_id: ChatId,
         context: Context,
-        bot: Bot = Provide["bot.client"],
+        outbox: Outbox = Provide["bot.outbox"],
     ) -> None:
-        await bot.send_message(chat_id, "Недопустимый ввод!")
+        outbox.send_message(chat_id, "Недопустимый ввод!")
 
     @typing.final
     async def validate(self, message: Message, chat_id: ChatId, context: Context) -> None:
@@ -83,30 +164,36 @@ class ChoiceByMessage(ValidateOnMessage, ABC):
     """
     Обработка выбора по тексту сообщения. Атрибут options – варианты выбора.
     Если текст – это один из вариантов, то вызовется on_correct, иначе – on_incorrect.
+    Варианты запрашиваются один раз и хранятся множеством: проверка сообщения – один поиск без ожиданий.
     """
 
+    _options: frozenset[str] | None = None
+
     @abstractmethod
-    async def options(self) -> typing.Sequence[str]: ...
+    async def options(self) -> typing.Collection[str]: ...
 
     @typing.final
     async def validator(self, message: Message) -> str | None:
-        options = await self.options()
-        if message.text in options:
+        if self._options is None:
+            self._options = frozenset(await self.options())
+        if message.text in self._options:
             return message.text
 
 
 class SwitchStateByMessage(ChoiceByMessage, ABC):
     """
     Переключает состояние в соответствии с текстом получаемого сообщения.
-    Атрибут options_switcher – словарь, где ключ – текст сообщения, значение – название состояния.
+    switch_options – словарь, где ключ – текст сообщения, значение – код состояния; запрашивается один раз.
+    По умолчанию это static_routes: такие маршруты StateMachine компилирует при создании и переключает
+    состояние одним поиском в словаре, не вызывая after_action_switcher.
     """
 
-    _switch_options: dict[str, StateCode] | None = None
+    _switch_options: typing.Mapping[str, StateCode] | None = None
 
-    @abstractmethod
-    async def switch_options(self) -> dict[str, StateCode]: ...
+    async def switch_options(self) -> typing.Mapping[str, StateCode]:
+        return self.static_routes
 
-    async def _get_switch_options(self) -> dict[str, StateCode]:
+    async def _get_switch_options(self) -> typing.Mapping[str, StateCode]:
         if self._switch_options is None:
             self._switch_options = await self.switch_options()
         return self._switch_options
@@ -120,11 +207,23 @@ class SwitchStateByMessage(ChoiceByMessage, ABC):
         if not isinstance(action, Message):
             return
 
-        switch_options = await self._get_switch_options()
+        # Варианты уже загружены проверкой сообщения в message_handler
+        switch_options = self._switch_options if self._switch_options is not None else await self._get_switch_options()
         if state_code := switch_options.get(action.text):
             return state_code
 
 
+def _freeze(value: typing.Any) -> typing.Hashable:
+    """Хешируемое представление значения контекста для ключа кеша."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
 class ClearVarsOnExit(ABC):
     """Удаляет переменные контекста, перечисленные в атрибуте clearing_vars."""
 
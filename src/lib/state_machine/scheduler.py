@@ -0,0 +1,41 @@
+import asyncio
+import typing
+
+from ..keyed_lock import KeyedLock
+from .state_machine import Action, ChatId
+
+ActionHandler: typing.TypeAlias = typing.Callable[[Action], typing.Awaitable[typing.Any]]
+
+
+class ChatScheduler:
+    """
+    Планировщик обработки действий.
+    Действия одного чата выполняются строго по очереди, действия разных чатов – параллельно,
+    но не более max_concurrency одновременно. Очередь чата удаляется, как только она опустела.
+    """
+
+    def __init__(self, handler: ActionHandler, max_concurrency: int = 100) -> None:
+        self._handler = handler
+        self._chat_locks: KeyedLock[ChatId] = KeyedLock()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+
+    @property
+    def active_chats(self) -> int:
+        """Количество чатов с обрабатываемыми или ожидающими действиями."""
+        return len(self._chat_locks)
+
+    @property
+    def in_flight(self) -> int:
+        """Количество действий, обрабатываемых прямо сейчас."""
+        return self._in_flight
+
+    async def handle_action(self, action: Action) -> None:
+        """Обработать действие в очереди его чата."""
+        chat_id = ChatId(action.from_user.id)
+        async with self._chat_locks(chat_id), self._semaphore:
+            self._in_flight += 1
+            try:
+                await self._handler(action)
+            finally:
+                self._in_flight -= 1
@@ -1,10 +1,15 @@
 import abc
+import logging
 import typing
 from collections import UserDict
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, nullcontext
 
+from aiogram.methods import AnswerCallbackQuery
 from aiogram.types import Message, CallbackQuery
 
+if typing.TYPE_CHECKING:
+    from ..outbox import Outbox
+
 __all__ = [
     "ChatId",
     "State",
@@ -14,9 +19,10 @@ __all__ = [
     "Context",
     "Action",
     "SwitcherResult",
+    "ChatSnapshot",
 ]
 
-from lib.state_machine.storages.base import StateMachineStorage
+logger = logging.getLogger(__name__)
 
 ChatId = typing.NewType("ChatId", int)
 StateCode = typing.NewType("StateCode", str)
@@ -25,11 +31,63 @@ Action = Message | CallbackQuery
 
 
 class Context(UserDict[str, typing.Any]):
+    """
+    Контекстные переменные пользователя.
+    Отслеживает изменённые и удалённые ключи, чтобы хранилище могло пропустить или сократить запись.
+    Изменяемые значения (list, dict, set), полученные по ключу, считаются изменёнными.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._changed_keys: set[str] = set()
+        self._deleted_keys: set[str] = set()
+        super().__init__(*args, **kwargs)
+        self.mark_clean()
+
+    def __getitem__(self, key: str) -> typing.Any:
+        value = super().__getitem__(key)
+        if isinstance(value, (list, dict, set)):
+            self._changed_keys.add(key)
+        return value
+
+    def __setitem__(self, key: str, value: typing.Any) -> None:
+        self.data[key] = value
+        self._changed_keys.add(key)
+        self._deleted_keys.discard(key)
+
+    def __delitem__(self, key: str) -> None:
+        del self.data[key]
+        self._changed_keys.discard(key)
+        self._deleted_keys.add(key)
+
+    @property
+    def changed_keys(self) -> frozenset[str]:
+        """Ключи, значения которых были установлены или могли быть изменены."""
+        return frozenset(self._changed_keys)
+
+    @property
+    def deleted_keys(self) -> frozenset[str]:
+        """Удалённые ключи."""
+        return frozenset(self._deleted_keys)
+
+    @property
+    def is_dirty(self) -> bool:
+        """Был ли контекст изменён с момента загрузки или сохранения."""
+        return bool(self._changed_keys or self._deleted_keys)
+
+    def changes(self) -> dict[str, typing.Any]:
+        """Изменённые ключи с их текущими значениями."""
+        return {key: self.data[key] for key in self._changed_keys}
+
+    def mark_clean(self) -> None:
+        """Сбросить отслеживание изменений (после загрузки или сохранения)."""
+        self._changed_keys.clear()
+        self._deleted_keys.clear()
+
     def delete_keys(self, *keys: str) -> None:
         """Удаляет перечисленные ключи."""
         for key in keys:
             try:
-                del self.data[key]
+                del self[key]
             except KeyError:
                 pass
 
@@ -40,6 +98,27 @@ class State(abc.ABC):
     def code(self) -> StateCode:
         return StateCode(self.__class__.__name__)
 
+    @property
+    def static_routes(self) -> typing.Mapping[str, StateCode]:
+        """
+        Переходы по тексту сообщения, известные заранее: текст -> код следующего состояния.
+        Компилируются StateMachine в таблицу маршрутов и имеют приоритет над after_action_switcher.
+        """
+        return {}
+
+    @property
+    def transitions(self) -> typing.Collection[StateCode]:
+        """Коды состояний, в которые switcher'ы могут переключить помимо static_routes (для проверки графа)."""
+        return ()
+
+    @property
+    def answers_callback(self) -> bool:
+        """
+        callback_handler сам отвечает на обратный вызов (answerCallbackQuery с текстом или show_alert).
+        Иначе StateMachine отвечает на обратный вызов пустым ответом до вызова обработчика.
+        """
+        return False
+
     async def on_enter(self, chat_id: ChatId, context: Context) -> None:
         """Вызывается при переходе в это состояние."""
         ...
@@ -77,6 +156,13 @@ class State(abc.ABC):
         ...
 
 
+from .storages.base import StateMachineStorage, ChatSnapshot  # noqa: E402
+from .instrumentation import StateMachineMetrics, InstrumentedStorage  # noqa: E402
+
+_NOT_TIMED = nullcontext()
+_NOT_BUFFERED = nullcontext()
+
+
 def _make_states_dict(states: typing.Iterable[State]) -> dict[str, State]:
     states_dict = {}
     for state in states:
@@ -85,71 +171,169 @@ def _make_states_dict(states: typing.Iterable[State]) -> dict[str, State]:
     return states_dict
 
 
+def _compile_routes(states: dict[str, State]) -> dict[tuple[StateCode, str], State]:
+    """Собрать таблицу маршрутов (код состояния, текст сообщения) -> следующее состояние."""
+    routes = {}
+    for state in states.values():
+        for text, next_state_code in state.static_routes.items():
+            assert next_state_code in states, f"Неизвестное состояние «{next_state_code}» в маршрутах «{state.code}»."
+            routes[(state.code, text)] = states[next_state_code]
+    return routes
+
+
+def _check_reachability(states: dict[str, State], default_state_code: StateCode) -> None:
+    """
+    Проверить, что все объявленные переходы ведут в существующие состояния и все состояния достижимы.
+    Переходы состояния без static_routes и transitions неизвестны: если такое состояние достижимо,
+    из него может вести что угодно, и о недостижимых состояниях не предупреждается.
+    """
+    for state in states.values():
+        for next_state_code in (*state.static_routes.values(), *state.transitions):
+            assert next_state_code in states, f"Неизвестное состояние «{next_state_code}» в переходах «{state.code}»."
+
+    reachable, queue = {default_state_code}, [default_state_code]
+    while queue:
+        state = states[queue.pop()]
+        if not state.static_routes and not state.transitions:
+            return
+        for next_state_code in (*state.static_routes.values(), *state.transitions):
+            if next_state_code not in reachable:
+                reachable.add(next_state_code)
+                queue.append(next_state_code)
+    if unreachable := states.keys() - reachable:
+        logger.warning("Состояния не достижимы по объявленным переходам: %s", ", ".join(sorted(unreachable)))
+
+
 class StateMachine:
     def __init__(
         self,
         states: typing.Collection[State],
         default_state_code: StateCode,
         storage: StateMachineStorage,
+        metrics: StateMachineMetrics | None = None,
+        outbox: "Outbox | None" = None,
+        restore_archived: bool = False,
     ):
         self._states = _make_states_dict(states)
         assert default_state_code in self._states, f"Неизвестное состояние по умолчанию «{default_state_code}»"
         self._default_state = self._states[default_state_code]
-        self._storage = storage
+        self._routes = _compile_routes(self._states)
+        _check_reachability(self._states, default_state_code)
+        self._metrics = metrics
+        self._storage = InstrumentedStorage(storage, metrics) if metrics is not None else storage
+        # С outbox сообщения обработчиков буферизуются на время действия, а на обратные вызовы отвечается до обработчика
+        self._outbox = outbox
+        # Без архивации новый чат не ищется в архиве: это лишний запрос на каждого нового пользователя
+        self._restore_archived = restore_archived
 
-    async def _get_state(self, chat_id: ChatId) -> State | None:
-        """Получить текущее состояние по идентификатору чата."""
-        state_code = await self._storage.get_state(chat_id)
-        return self._states.get(state_code)
+    def _timed(self, hook: str, state: State) -> typing.ContextManager[None]:
+        """Измерить длительность обработчика состояния, если метрики включены."""
+        if self._metrics is None:
+            return _NOT_TIMED
+        return self._metrics.hook_duration.time(hook, state.code)
 
-    async def _set_state(self, chat_id: ChatId, state: State) -> None:
-        """Установить состояние по идентификатору чата."""
-        await self._storage.set_state(chat_id, state.code)
+    def _effects(self) -> typing.ContextManager[None]:
+        """
+        Буфер исходящих сообщений действия. Сообщения ставятся в очередь Outbox по завершении обработчиков
+        и отправляются одновременно с сохранением снимка; если обработчик упал, они не отправляются.
+        """
+        if self._outbox is None:
+            return _NOT_BUFFERED
+        return self._outbox.buffer()
 
     @asynccontextmanager
-    async def _context(self, chat_id: ChatId) -> typing.AsyncGenerator[Context, None]:
-        """Контекстный менеджер редактирования контекстных переменных пользователя."""
-        context = await self._storage.get_context(chat_id) or {}
-        try:
-            yield context
-        finally:
-            await self._storage.set_context(chat_id, context)
+    async def _snapshot(self, chat_id: ChatId) -> typing.AsyncGenerator[ChatSnapshot, None]:
+        """
+        Контекстный менеджер работы с состоянием и контекстом пользователя.
+        Загружает их одним запросом и сохраняет одним запросом при выходе.
+        Если обработка завершилась исключением, ничего не сохраняется – так же, как при откате транзакции
+        advisory-блокировки: чат остаётся в состоянии до действия при любой настройке хранилища.
+        """
+        snapshot = await self._storage.get_snapshot(chat_id)
+        yield snapshot
+        await self._storage.set_snapshot(chat_id, snapshot)
 
     async def _switch_state(
-        self, chat_id: ChatId, current_state: State | None, next_state: State, context: Context
+        self, chat_id: ChatId, current_state: State | None, next_state: State, snapshot: ChatSnapshot
     ) -> None:
-        """Переключить состояние пользователя, вызвав все надлежащие обработчики."""
-        if current_state is not None:
-            await current_state.on_exit(chat_id=chat_id, context=context)
-        await next_state.on_enter(chat_id=chat_id, context=context)
-        await self._set_state(chat_id, next_state)
-        next_state_name = await next_state.after_enter_switcher(context=context)
-        while next_state_name is not None:
+        """
+        Переключить состояние пользователя, вызвав все надлежащие обработчики.
+        Промежуточные состояния в хранилище не записываются, сохраняется только итоговое.
+        """
+        context = snapshot.context
+        while True:
+            if current_state is not None:
+                with self._timed("on_exit", current_state):
+                    await current_state.on_exit(chat_id=chat_id, context=context)
+            with self._timed("on_enter", next_state):
+                await next_state.on_enter(chat_id=chat_id, context=context)
+            snapshot.state_code = next_state.code
+            if self._metrics is not None:
+                self._metrics.state_switches.inc(next_state.code)
+            with self._timed("after_enter_switcher", next_state):
+                next_state_name = await next_state.after_enter_switcher(context=context)
+            if next_state_name is None:
+                return
             current_state, next_state = next_state, self._states[next_state_name]
-            await current_state.on_exit(chat_id=chat_id, context=context)
-            await next_state.on_enter(chat_id=chat_id, context=context)
-            await self._set_state(chat_id, next_state)
-            next_state_name = await next_state.after_enter_switcher(context=context)
 
     async def handle_action(self, action: Action):
         """Обработать действие (сообщение или обратный вызов)."""
+        if self._metrics is None:
+            return await self._handle_action(action)
+        with self._metrics.track_action():
+            return await self._handle_action(action)
+
+    async def _handle_action(self, action: Action):
         chat_id = ChatId(action.from_user.id)
+        async with self._storage.lock(chat_id), self._snapshot(chat_id) as snapshot:
+            # Буфер закрывается раньше снимка: сообщения уходят, пока снимок сохраняется
+            with self._effects():
+                await self._process_action(action, chat_id, snapshot)
 
-        async with self._context(chat_id) as context:
-            # Получение текущего состояния
-            current_state = await self._get_state(chat_id)
-            if current_state is None:
-                # Новый пользователь или пользователь с состоянием, которое больше не доступно
-                await self._switch_state(chat_id, None, self._default_state, context)
-                return
+    async def _process_action(self, action: Action, chat_id: ChatId, snapshot: ChatSnapshot) -> None:
+        """Вызвать обработчики текущего состояния и переключить состояние."""
+        context = snapshot.context
+
+        # Получение текущего состояния
+        current_state = self._states.get(snapshot.state_code)
+        if (
+            snapshot.state_code is None
+            and self._restore_archived
+            and (restored := await self._storage.restore_archived(chat_id))
+        ):
+            # Пользователь, перенесённый в архив после долгого бездействия, продолжает с того же места
+            snapshot.state_code, snapshot.context = restored.state_code, restored.context
+            context = snapshot.context
+            current_state = self._states.get(snapshot.state_code)
+        if (
+            isinstance(action, CallbackQuery)
+            and self._outbox is not None
+            and (current_state is None or not current_state.answers_callback)
+        ):
+            # Пока на обратный вызов не ответили, Telegram показывает на кнопке индикатор загрузки.
+            # Второй ответ Telegram отклоняет, поэтому состояния, отвечающие сами, здесь не отвечают
+            self._outbox.send_now(AnswerCallbackQuery(callback_query_id=action.id))
+        if current_state is None:
+            # Новый пользователь или пользователь с состоянием, которое больше не доступно
+            await self._switch_state(chat_id, None, self._default_state, snapshot)
+            return
 
-            # Вызов обработчиков
-            if isinstance(action, Message):
+        # Вызов обработчиков
+        if isinstance(action, Message):
+            with self._timed("message_handler", current_state):
                 await current_state.message_handler(message=action, chat_id=chat_id, context=context)
-            elif isinstance(action, CallbackQuery):
+        elif isinstance(action, CallbackQuery):
+            with self._timed("callback_handler", current_state):
                 await current_state.callback_handler(query=action, chat_id=chat_id, context=context)
 
-            # Переключение состояния
-            if next_state_code := await current_state.after_action_switcher(action, context):
+        # Переключение состояния
+        next_state = None
+        if isinstance(action, Message):
+            next_state = self._routes.get((current_state.code, action.text))
+        if next_state is None:
+            with self._timed("after_action_switcher", current_state):
+                next_state_code = await current_state.after_action_switcher(action, context)
+            if next_state_code:
                 next_state = self._states[next_state_code]
-                await self._switch_state(chat_id, current_state, next_state, context)
+        if next_state is not None:
+            await self._switch_state(chat_id, current_state, next_state, snapshot)
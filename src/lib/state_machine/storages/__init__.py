@@ -1,2 +1,35 @@
-from .pg import PGStateMachineStorage  # noqa: F401
-from .sqlite import SQLiteInMemoryStorage  # noqa: F401
+"""
+Хранилища импортируются при первом обращении: каждое тянет свои зависимости (databases, asyncpg, sqlite3),
+а процессу обычно нужно одно из них.
+"""
+import importlib
+import typing
+
+if typing.TYPE_CHECKING:
+    from .pg import PGStateMachineStorage  # noqa: F401
+    from .pg_buffered import BufferedPGStateMachineStorage  # noqa: F401
+    from .pg_native import AsyncpgStateMachineStorage  # noqa: F401
+    from .sqlite import SQLiteInMemoryStorage  # noqa: F401
+    from .sqlite_async import AsyncSQLiteStorage  # noqa: F401
+    from .memory import MemoryStorage  # noqa: F401
+    from .cached import CachedStorage  # noqa: F401
+
+_MODULES = {
+    "PGStateMachineStorage": ".pg",
+    "BufferedPGStateMachineStorage": ".pg_buffered",
+    "AsyncpgStateMachineStorage": ".pg_native",
+    "SQLiteInMemoryStorage": ".sqlite",
+    "AsyncSQLiteStorage": ".sqlite_async",
+    "MemoryStorage": ".memory",
+    "CachedStorage": ".cached",
+}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name: str) -> typing.Any:
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_MODULES[name], __name__), name)
+    globals()[name] = value
+    return value
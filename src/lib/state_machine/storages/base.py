@@ -1,6 +1,18 @@
 import abc
+import contextlib
+import typing
 
-from ..state_machine import ChatId, Context
+from ..state_machine import ChatId, Context, StateCode
+
+
+class ChatSnapshot:
+    """Состояние и контекст чата, загруженные и сохраняемые вместе."""
+
+    __slots__ = ("state_code", "context")
+
+    def __init__(self, state_code: StateCode | None, context: Context) -> None:
+        self.state_code = state_code
+        self.context = context
 
 
 class StateMachineStorage(abc.ABC):
@@ -23,3 +35,36 @@ class StateMachineStorage(abc.ABC):
     async def set_context(self, chat_id: ChatId, context: Context) -> None:
         """Установить контекстные переменные пользователя. Пользователь будет добавлен, если не существовал."""
         ...
+
+    async def get_snapshot(self, chat_id: ChatId) -> ChatSnapshot:
+        """
+        Получить состояние и контекст пользователя.
+        Хранилища, умеющие сделать это за один запрос, должны переопределить метод.
+        """
+        state_code = await self.get_state(chat_id)
+        context = await self.get_context(chat_id)
+        return ChatSnapshot(state_code, context if context is not None else Context())
+
+    async def set_snapshot(self, chat_id: ChatId, snapshot: ChatSnapshot) -> None:
+        """
+        Сохранить состояние и контекст пользователя. Если состояние не задано, сохраняется только контекст.
+        Хранилища, умеющие сделать это за один запрос, должны переопределить метод.
+        """
+        if snapshot.state_code is not None:
+            await self.set_state(chat_id, snapshot.state_code)
+        await self.set_context(chat_id, snapshot.context)
+
+    async def restore_archived(self, chat_id: ChatId) -> ChatSnapshot | None:
+        """
+        Вернуть чат из архива, куда он перенесён после долгого бездействия (см. ChatArchiver).
+        Возвращает восстановленные состояние и контекст или None, если чата в архиве нет.
+        По умолчанию архива нет.
+        """
+        return None
+
+    def lock(self, chat_id: ChatId) -> typing.AsyncContextManager[None]:
+        """
+        Исключительная блокировка чата на время обработки действия, в том числе между процессами.
+        По умолчанию не блокирует: порядок обработки внутри процесса обеспечивает ChatScheduler.
+        """
+        return contextlib.nullcontext()
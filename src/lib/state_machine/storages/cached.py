@@ -0,0 +1,167 @@
+import time
+import typing
+from collections import OrderedDict
+
+from ...codecs import ContextCodec, JsonCodec
+from .base import StateMachineStorage, Context, ChatId, ChatSnapshot
+from ..state_machine import StateCode
+
+
+class _Entry:
+    """Закешированный чат. Контекст хранится сериализованным: так он компактнее и не меняется в обход записи."""
+
+    __slots__ = ("state_code", "context", "expires_at")
+
+    def __init__(self, state_code: StateCode | None, context: bytes | None, expires_at: float) -> None:
+        self.state_code = state_code
+        self.context = context
+        self.expires_at = expires_at
+
+
+class CachedStorage(StateMachineStorage):
+    """
+    Кеш недавно активных чатов в памяти поверх другого хранилища.
+
+    Чтение идёт из кеша, пока запись не старше ttl секунд; запись всегда передаётся в storage и после
+    успешного сохранения обновляет кеш. Поверх PGStateMachineStorage или AsyncpgStateMachineStorage это запись
+    насквозь, поверх BufferedPGStateMachineStorage – отложенная запись. Размер кеша ограничен количеством чатов
+    и суммарным размером контекстов, при переполнении вытесняются давно не использованные чаты.
+
+    Кеш корректен, пока чат обрабатывается одним процессом: при workers.count > 1 обновления распределяются
+    по процессам по пользователю, а изменения, сделанные в базе в обход бота, станут видны не позже чем через ttl.
+    """
+
+    def __init__(
+        self,
+        storage: StateMachineStorage,
+        max_chats: int = 10_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 600,
+        codec: ContextCodec = JsonCodec(),
+    ) -> None:
+        self._storage = storage
+        self._max_chats = max_chats
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._codec = codec
+        self._entries: OrderedDict[ChatId, _Entry] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Доля чтений, обслуженных кешем."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict[str, float]:
+        """Счётчики кеша и его текущий размер."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "chats": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    async def get_state(self, chat_id: ChatId) -> StateCode | None:
+        return (await self._get(chat_id)).state_code
+
+    async def set_state(self, chat_id: ChatId, state_name: StateCode) -> None:
+        await self._write(chat_id, self._storage.set_state(chat_id, state_name), state_name, None)
+
+    async def get_context(self, chat_id: ChatId) -> Context | None:
+        entry = await self._get(chat_id)
+        return Context(self._codec.decode(entry.context)) if entry.context is not None else None
+
+    async def set_context(self, chat_id: ChatId, context: Context) -> None:
+        encoded = self._codec.encode(context) if context.is_dirty else None
+        await self._write(chat_id, self._storage.set_context(chat_id, context), None, encoded)
+
+    async def get_snapshot(self, chat_id: ChatId) -> ChatSnapshot:
+        entry = await self._get(chat_id)
+        context = Context(self._codec.decode(entry.context)) if entry.context is not None else Context()
+        return ChatSnapshot(entry.state_code, context)
+
+    async def set_snapshot(self, chat_id: ChatId, snapshot: ChatSnapshot) -> None:
+        # Контекст сериализуется до записи: хранилище сбрасывает отметку об изменениях после сохранения.
+        encoded = self._codec.encode(snapshot.context) if snapshot.context.is_dirty else None
+        await self._write(chat_id, self._storage.set_snapshot(chat_id, snapshot), snapshot.state_code, encoded)
+
+    async def restore_archived(self, chat_id: ChatId) -> ChatSnapshot | None:
+        snapshot = await self._storage.restore_archived(chat_id)
+        if snapshot is not None:
+            self.invalidate(chat_id)  # в кеше чат записан как новый
+        return snapshot
+
+    def lock(self, chat_id: ChatId) -> typing.AsyncContextManager[None]:
+        return self._storage.lock(chat_id)
+
+    def invalidate(self, chat_id: ChatId) -> None:
+        """Удалить чат из кеша, например после изменения в базе в обход бота."""
+        if (entry := self._entries.pop(chat_id, None)) is not None:
+            self._bytes -= _size(entry)
+
+    async def _get(self, chat_id: ChatId) -> _Entry:
+        entry = self._entries.get(chat_id)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self.invalidate(chat_id)
+            self.expirations += 1
+            entry = None
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(chat_id)
+            return entry
+
+        self.misses += 1
+        snapshot = await self._storage.get_snapshot(chat_id)
+        context = self._codec.encode(snapshot.context) if snapshot.context else None
+        entry = _Entry(snapshot.state_code, context, time.monotonic() + self._ttl)
+        self._put(chat_id, entry)
+        return entry
+
+    async def _write(
+        self,
+        chat_id: ChatId,
+        write: typing.Awaitable[None],
+        state_code: StateCode | None,
+        context: bytes | None,
+    ) -> None:
+        """Дождаться записи в хранилище и обновить закешированный чат. Если записать не удалось, чат удаляется."""
+        try:
+            await write
+        except BaseException:
+            self.invalidate(chat_id)
+            raise
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return  # чат неизвестен целиком – будет загружен при следующем чтении
+        self._bytes -= _size(entry)
+        if state_code is not None:
+            entry.state_code = state_code
+        if context is not None:
+            entry.context = context
+        entry.expires_at = time.monotonic() + self._ttl
+        self._bytes += _size(entry)
+        self._entries.move_to_end(chat_id)
+        self._evict()
+
+    def _put(self, chat_id: ChatId, entry: _Entry) -> None:
+        self.invalidate(chat_id)
+        self._entries[chat_id] = entry
+        self._bytes += _size(entry)
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self._entries) > self._max_chats or (self._bytes > self._max_bytes and len(self._entries) > 1):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= _size(entry)
+            self.evictions += 1
+
+
+def _size(entry: _Entry) -> int:
+    return len(entry.context) if entry.context is not None else 0
@@ -0,0 +1,31 @@
+from ...codecs import ContextCodec, JsonCodec
+from .base import StateMachineStorage, Context, ChatId
+from ..state_machine import StateCode
+
+
+class MemoryStorage(StateMachineStorage):
+    """
+    Хранилище в памяти процесса, для разработки и измерений.
+    Контекст хранится сериализованным, чтобы изменения вне хранилища не попадали в него в обход set_context.
+    """
+
+    def __init__(self, codec: ContextCodec = JsonCodec()) -> None:
+        self._codec = codec
+        self._states: dict[ChatId, StateCode] = {}
+        self._contexts: dict[ChatId, bytes] = {}
+
+    async def get_state(self, chat_id: ChatId) -> StateCode | None:
+        return self._states.get(chat_id)
+
+    async def set_state(self, chat_id: ChatId, state_name: StateCode) -> None:
+        self._states[chat_id] = state_name
+
+    async def get_context(self, chat_id: ChatId) -> Context | None:
+        context = self._contexts.get(chat_id)
+        return Context(self._codec.decode(context)) if context is not None else None
+
+    async def set_context(self, chat_id: ChatId, context: Context) -> None:
+        if not context.is_dirty:
+            return
+        self._contexts[chat_id] = self._codec.encode(context)
+        context.mark_clean()
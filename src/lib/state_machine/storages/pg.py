@@ -1,14 +1,43 @@
+import typing
+from contextlib import asynccontextmanager
 from textwrap import dedent
 
 from databases import Database
 
-from .base import StateMachineStorage, Context, ChatId
+from . import pg_queries
+from .base import StateMachineStorage, Context, ChatId, ChatSnapshot
 from ..state_machine import StateCode
 
 
+# Параметры databases с явными типами: без них PostgreSQL не выведет типы выражений с jsonb и массивами.
+_PARAMS = {
+    "chat_id": "(:chat_id)::bigint",
+    "state_code": "(:state_code)::text",
+    "changes": "(:changes)::jsonb",
+    "deleted": "(:deleted)::text[]",
+}
+
+_GET_SNAPSHOT = pg_queries.GET_SNAPSHOT.format(**_PARAMS)
+
+_UPSERT_STATE = pg_queries.UPSERT_STATE.format(**_PARAMS)
+
+_UPSERT_CONTEXT_CHANGES = pg_queries.UPSERT_CONTEXT_CHANGES.format(**_PARAMS)
+
+_UPSERT_SNAPSHOT = pg_queries.UPSERT_SNAPSHOT.format(**_PARAMS)
+
+_RESTORE_ARCHIVED = pg_queries.RESTORE_ARCHIVED.format(**_PARAMS)
+
+
 class PGStateMachineStorage(StateMachineStorage):
-    def __init__(self, db: Database):
+    """
+    Хранилище в PostgreSQL.
+    С advisory_lock=True действие обрабатывается в транзакции под pg_advisory_xact_lock(chat_id), что
+    защищает состояние чата, если обновления одного чата по ошибке попали в разные процессы.
+    """
+
+    def __init__(self, db: Database, advisory_lock: bool = False):
         self._db = db
+        self._advisory_lock = advisory_lock
 
     async def get_state(self, chat_id: ChatId) -> StateCode | None:
         stmt = dedent("""
@@ -19,11 +48,7 @@ class PGStateMachineStorage(StateMachineStorage):
         return await self._db.fetch_val(stmt, {"chat_id": chat_id})
 
     async def set_state(self, chat_id: ChatId, state_name: StateCode) -> None:
-        stmt = dedent("""
-            insert into bot.chat_state (chat_id, state_code) values ((:chat_id)::bigint, (:state_code)::text)
-            on conflict (chat_id) do update set state_code = excluded.state_code;
-        """)
-        await self._db.execute(stmt, {"chat_id": chat_id, "state_code": state_name})
+        await self._db.execute(_UPSERT_STATE, {"chat_id": chat_id, "state_code": state_name})
 
     async def get_context(self, chat_id: ChatId) -> Context | None:
         stmt = dedent("""
@@ -37,8 +62,43 @@ class PGStateMachineStorage(StateMachineStorage):
         return Context(record)
 
     async def set_context(self, chat_id: ChatId, context: Context) -> None:
-        stmt = dedent("""
-            insert into bot.chat_context (chat_id, context) values ((:chat_id)::bigint, (:context)::jsonb)
-            on conflict (chat_id) do update set context = excluded.context;
-        """)
-        await self._db.execute(stmt, {"chat_id": chat_id, "context": context})
+        if not context.is_dirty:
+            return
+        await self._db.execute(_UPSERT_CONTEXT_CHANGES, _context_changes_params(chat_id, context))
+        context.mark_clean()
+
+    async def get_snapshot(self, chat_id: ChatId) -> ChatSnapshot:
+        record = await self._db.fetch_one(_GET_SNAPSHOT, {"chat_id": chat_id})
+        context = record["context"]
+        return ChatSnapshot(record["state_code"], Context(context) if context is not None else Context())
+
+    async def set_snapshot(self, chat_id: ChatId, snapshot: ChatSnapshot) -> None:
+        if snapshot.state_code is None:
+            return await self.set_context(chat_id, snapshot.context)
+        if not snapshot.context.is_dirty:
+            return await self.set_state(chat_id, snapshot.state_code)
+        params = _context_changes_params(chat_id, snapshot.context) | {"state_code": snapshot.state_code}
+        await self._db.execute(_UPSERT_SNAPSHOT, params)
+        snapshot.context.mark_clean()
+
+    async def restore_archived(self, chat_id: ChatId) -> ChatSnapshot | None:
+        record = await self._db.fetch_one(_RESTORE_ARCHIVED, {"chat_id": chat_id})
+        if record is None:
+            return None
+        context = record["context"]
+        return ChatSnapshot(record["state_code"], Context(context) if context is not None else Context())
+
+    def lock(self, chat_id: ChatId) -> typing.AsyncContextManager[None]:
+        if not self._advisory_lock:
+            return super().lock(chat_id)
+        return self._lock(chat_id)
+
+    @asynccontextmanager
+    async def _lock(self, chat_id: ChatId) -> typing.AsyncGenerator[None, None]:
+        async with self._db.transaction():
+            await self._db.execute("select pg_advisory_xact_lock((:chat_id)::bigint)", {"chat_id": chat_id})
+            yield
+
+
+def _context_changes_params(chat_id: ChatId, context: Context) -> dict:
+    return {"chat_id": chat_id, "changes": context.changes(), "deleted": list(context.deleted_keys)}
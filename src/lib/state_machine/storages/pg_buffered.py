@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import typing
+import asyncpg
+
+from ...codecs import JsonCodec
+from . import pg_queries
+from .base import Context, ChatId, ChatSnapshot
+from .pg_native import AsyncpgStateMachineStorage
+from ..state_machine import StateCode
+
+logger = logging.getLogger(__name__)
+
+_codec = JsonCodec()
+
+Durability: typing.TypeAlias = typing.Literal["buffer", "flush"]
+
+
+class _Batch:
+    """Записи, ожидающие сброса в базу данных одним запросом."""
+
+    __slots__ = ("states", "contexts", "flushed")
+
+    def __init__(self) -> None:
+        self.states: dict[ChatId, StateCode] = {}
+        self.contexts: dict[ChatId, str] = {}  # контекст в JSON, сериализованный в момент записи
+        self.flushed: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def __len__(self) -> int:
+        return len(self.states) + len(self.contexts)
+
+
+# Записи пакета – многострочные upsert по unnest массивов.
+_UPSERT_STATES = """
+insert into bot.chat_state (chat_id, state_code)
+select s.chat_id, s.state_code
+from unnest($1::bigint[], $2::text[]) as s(chat_id, state_code)
+""" + pg_queries.ON_STATE_CONFLICT.lstrip("\n")
+
+_UPSERT_CONTEXTS = """
+insert into bot.chat_context (chat_id, context)
+select c.chat_id, c.context::jsonb
+from unnest($1::bigint[], $2::text[]) as c(chat_id, context)
+on conflict (chat_id) do update set context = excluded.context
+"""
+
+
+class BufferedPGStateMachineStorage(AsyncpgStateMachineStorage):
+    """
+    Хранилище в PostgreSQL с отложенной записью.
+    Записи накапливаются в памяти и сбрасываются многострочными upsert по unnest каждые flush_interval
+    секунд или при накоплении max_batch_size строк. Чтение учитывает ещё не сброшенные записи.
+
+    Durability:
+     - "buffer" – запись завершается сразу после помещения в буфер, данные за последний интервал
+       могут быть потеряны при падении процесса;
+     - "flush" – запись завершается после сброса буфера в базу данных.
+
+    Advisory-блокировка здесь не поддерживается: запись происходит уже после её освобождения.
+    """
+
+    def __init__(
+        self,
+        pool: asyncpg.Pool,
+        flush_interval: float = 0.05,
+        max_batch_size: int = 1000,
+        durability: Durability = "flush",
+    ):
+        super().__init__(pool, advisory_lock=False)
+        self._flush_interval = flush_interval
+        self._max_batch_size = max_batch_size
+        self._durability = durability
+        self._pending: _Batch | None = None
+        self._flushing: _Batch | None = None
+        self._batch_full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._closed = False
+
+    async def get_state(self, chat_id: ChatId) -> StateCode | None:
+        for batch in self._batches():
+            if chat_id in batch.states:
+                return batch.states[chat_id]
+        return await super().get_state(chat_id)
+
+    async def set_state(self, chat_id: ChatId, state_name: StateCode) -> None:
+        batch = self._batch()
+        batch.states[chat_id] = state_name
+        await self._after_write(batch)
+
+    async def get_context(self, chat_id: ChatId) -> Context | None:
+        for batch in self._batches():
+            if chat_id in batch.contexts:
+                return Context(_codec.decode(batch.contexts[chat_id]))
+        return await super().get_context(chat_id)
+
+    async def set_context(self, chat_id: ChatId, context: Context) -> None:
+        if not context.is_dirty:
+            return
+        batch = self._batch()
+        batch.contexts[chat_id] = _codec.encode(context).decode()
+        context.mark_clean()
+        await self._after_write(batch)
+
+    async def get_snapshot(self, chat_id: ChatId) -> ChatSnapshot:
+        state_code, context = None, None
+        for batch in reversed(list(self._batches())):
+            state_code = batch.states.get(chat_id, state_code)
+            context = batch.contexts.get(chat_id, context)
+        if state_code is not None and context is not None:
+            return ChatSnapshot(state_code, Context(_codec.decode(context)))
+
+        snapshot = await super().get_snapshot(chat_id)
+        if state_code is not None:
+            snapshot.state_code = state_code
+        if context is not None:
+            snapshot.context = Context(_codec.decode(context))
+        return snapshot
+
+    async def set_snapshot(self, chat_id: ChatId, snapshot: ChatSnapshot) -> None:
+        if snapshot.state_code is None and not snapshot.context.is_dirty:
+            return
+        batch = self._batch()
+        if snapshot.state_code is not None:
+            batch.states[chat_id] = snapshot.state_code
+        if snapshot.context.is_dirty:
+            batch.contexts[chat_id] = _codec.encode(snapshot.context).decode()
+            snapshot.context.mark_clean()
+        await self._after_write(batch)
+
+    async def close(self) -> None:
+        """
+        Остановить фоновый сброс и сбросить накопленные записи.
+        Фоновый сброс не отменяется, а завершается после текущего пакета, чтобы пакет не потерялся.
+        """
+        self._closed = True
+        if self._flusher is not None:
+            self._batch_full.set()
+            await asyncio.wait([self._flusher])
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Сбросить накопленные записи в базу данных."""
+        async with self._flush_lock:
+            batch, self._pending = self._pending, None
+            self._batch_full.clear()
+            if batch is None:
+                return
+
+            self._flushing = batch
+            try:
+                await self._write_batch(batch)
+            except asyncio.CancelledError:
+                # Записи возвращаются в буфер, а ожидающие сброса получают отмену, а не ждут бесконечно
+                batch.flushed.cancel()
+                self._requeue(batch)
+                raise
+            except Exception as error:
+                logger.exception("Не удалось сбросить %d записей состояния чатов", len(batch))
+                batch.flushed.set_exception(error)
+                batch.flushed.exception()  # ошибку получат ожидающие сброса, остальным она не нужна
+                self._requeue(batch)
+            else:
+                batch.flushed.set_result(None)
+            finally:
+                self._flushing = None
+
+    def _batches(self) -> typing.Iterator[_Batch]:
+        """Несброшенные пакеты, от новых к старым."""
+        if self._pending is not None:
+            yield self._pending
+        if self._flushing is not None:
+            yield self._flushing
+
+    def _batch(self) -> _Batch:
+        if self._pending is None:
+            self._pending = _Batch()
+        if (self._flusher is None or self._flusher.done()) and not self._closed:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+        return self._pending
+
+    async def _after_write(self, batch: _Batch) -> None:
+        if len(batch) >= self._max_batch_size:
+            self._batch_full.set()
+        if self._durability == "flush":
+            await asyncio.shield(batch.flushed)
+
+    async def _flush_periodically(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def _requeue(self, batch: _Batch) -> None:
+        """Вернуть несброшенные записи в буфер, не перетирая более новые."""
+        pending = self._batch()
+        pending.states = batch.states | pending.states
+        pending.contexts = batch.contexts | pending.contexts
+
+    async def _write_batch(self, batch: _Batch) -> None:
+        async with self._pool.acquire() as connection, connection.transaction():
+            if batch.states:
+                await connection.execute(_UPSERT_STATES, list(batch.states), list(batch.states.values()))
+            if batch.contexts:
+                await connection.execute(_UPSERT_CONTEXTS, list(batch.contexts), list(batch.contexts.values()))
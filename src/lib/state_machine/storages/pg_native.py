@@ -0,0 +1,126 @@
+import contextvars
+import typing
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from . import pg_queries
+from .base import StateMachineStorage, Context, ChatId, ChatSnapshot
+from ..state_machine import StateCode
+
+# Соединение, удерживаемое на время действия блокировкой lock, чтобы запросы действия шли через него же.
+_connection: contextvars.ContextVar[asyncpg.Connection | None] = contextvars.ContextVar("_connection", default=None)
+
+# Запросы – константы модуля: asyncpg подготавливает каждый один раз на соединение и дальше берёт из кеша
+# подготовленных выражений (statement_cache_size), без повторного разбора.
+
+_GET_STATE = "select s.state_code from bot.chat_state as s where s.chat_id = $1"
+
+_GET_CONTEXT = "select c.context from bot.chat_context as c where c.chat_id = $1"
+
+_GET_SNAPSHOT = pg_queries.GET_SNAPSHOT.format(chat_id="$1::bigint")
+
+_UPSERT_STATE = pg_queries.UPSERT_STATE.format(chat_id="$1", state_code="$2")
+
+_CONTEXT_CHANGES_PARAMS = {"chat_id": "$1::bigint", "changes": "$2::jsonb", "deleted": "$3::text[]"}
+
+_UPSERT_CONTEXT_CHANGES = pg_queries.UPSERT_CONTEXT_CHANGES.format(**_CONTEXT_CHANGES_PARAMS)
+
+_UPSERT_SNAPSHOT = pg_queries.UPSERT_SNAPSHOT.format(**_CONTEXT_CHANGES_PARAMS, state_code="$4")
+
+_RESTORE_ARCHIVED = pg_queries.RESTORE_ARCHIVED.format(chat_id="$1::bigint")
+
+_ADVISORY_LOCK = "select pg_advisory_xact_lock($1)"
+
+
+class AsyncpgStateMachineStorage(StateMachineStorage):
+    """
+    Хранилище в PostgreSQL напрямую через asyncpg.Pool, без слоя databases: запросы не компилируются
+    и не переписываются при каждом вызове, а готовятся один раз на соединение.
+    Поведение совпадает с PGStateMachineStorage, включая частичную запись контекста и advisory_lock.
+    С advisory_lock=True соединение пула занято на всё действие, так что одновременно обрабатывается
+    не больше действий, чем соединений в пуле.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, advisory_lock: bool = False):
+        self._pool = pool
+        self._advisory_lock = advisory_lock
+
+    async def get_state(self, chat_id: ChatId) -> StateCode | None:
+        async with self._acquire() as connection:
+            return await connection.fetchval(_GET_STATE, chat_id)
+
+    async def set_state(self, chat_id: ChatId, state_name: StateCode) -> None:
+        async with self._acquire() as connection:
+            await connection.execute(_UPSERT_STATE, chat_id, state_name)
+
+    async def get_context(self, chat_id: ChatId) -> Context | None:
+        async with self._acquire() as connection:
+            context = await connection.fetchval(_GET_CONTEXT, chat_id)
+        return Context(context) if context is not None else None
+
+    async def set_context(self, chat_id: ChatId, context: Context) -> None:
+        if not context.is_dirty:
+            return
+        async with self._acquire() as connection:
+            await connection.execute(_UPSERT_CONTEXT_CHANGES, chat_id, context.changes(), list(context.deleted_keys))
+        context.mark_clean()
+
+    async def get_snapshot(self, chat_id: ChatId) -> ChatSnapshot:
+        async with self._acquire() as connection:
+            record = await connection.fetchrow(_GET_SNAPSHOT, chat_id)
+        context = record["context"]
+        return ChatSnapshot(record["state_code"], Context(context) if context is not None else Context())
+
+    async def set_snapshot(self, chat_id: ChatId, snapshot: ChatSnapshot) -> None:
+        if snapshot.state_code is None:
+            return await self.set_context(chat_id, snapshot.context)
+        if not snapshot.context.is_dirty:
+            return await self.set_state(chat_id, snapshot.state_code)
+        context = snapshot.context
+        async with self._acquire() as connection:
+            await connection.execute(
+                _UPSERT_SNAPSHOT, chat_id, context.changes(), list(context.deleted_keys), snapshot.state_code
+            )
+        context.mark_clean()
+
+    async def restore_archived(self, chat_id: ChatId) -> ChatSnapshot | None:
+        async with self._acquire() as connection:
+            record = await connection.fetchrow(_RESTORE_ARCHIVED, chat_id)
+        if record is None:
+            return None
+        context = record["context"]
+        return ChatSnapshot(record["state_code"], Context(context) if context is not None else Context())
+
+    def lock(self, chat_id: ChatId) -> typing.AsyncContextManager[None]:
+        if not self._advisory_lock:
+            return super().lock(chat_id)
+        return self._lock(chat_id)
+
+    def pool_stats(self) -> dict[str, int]:
+        """Размеры пула соединений."""
+        return {
+            "size": self._pool.get_size(),
+            "idle": self._pool.get_idle_size(),
+            "min_size": self._pool.get_min_size(),
+            "max_size": self._pool.get_max_size(),
+        }
+
+    @asynccontextmanager
+    async def _lock(self, chat_id: ChatId) -> typing.AsyncGenerator[None, None]:
+        async with self._pool.acquire() as connection, connection.transaction():
+            await connection.execute(_ADVISORY_LOCK, chat_id)
+            token = _connection.set(connection)
+            try:
+                yield
+            finally:
+                _connection.reset(token)
+
+    @asynccontextmanager
+    async def _acquire(self) -> typing.AsyncGenerator[asyncpg.Connection, None]:
+        """Соединение действия, если оно удерживается блокировкой, иначе соединение из пула."""
+        if (connection := _connection.get()) is not None:
+            yield connection
+            return
+        async with self._pool.acquire() as connection:
+            yield connection
@@ -0,0 +1,71 @@
+"""
+Запросы хранилищ PostgreSQL, общие для PGStateMachineStorage и AsyncpgStateMachineStorage.
+Запросы – шаблоны str.format с местами для параметров: хранилище подставляет свои параметры
+(именованные databases или позиционные asyncpg) один раз, при импорте модуля.
+"""
+
+GET_SNAPSHOT = """
+select s.state_code, c.context
+from (select {chat_id} as chat_id) as k
+    left join bot.chat_state as s on s.chat_id = k.chat_id
+    left join bot.chat_context as c on c.chat_id = k.chat_id
+"""
+
+# Строка состояния не перезаписывается, если состояние не изменилось: иначе каждое действие оставляло бы
+# мёртвую строку. Время последней активности seen_at меняется не чаще раза в сутки – точнее архивации
+# (см. ChatArchiver) не нужно, а обновление индексированного seen_at не может быть HOT.
+ON_STATE_CONFLICT = """
+on conflict (chat_id) do update
+set state_code = excluded.state_code,
+    seen_at    = case
+        when bot.chat_state.seen_at < current_timestamp - interval '1 day' then current_timestamp
+        else bot.chat_state.seen_at
+    end
+where bot.chat_state.state_code is distinct from excluded.state_code
+   or bot.chat_state.seen_at < current_timestamp - interval '1 day'
+"""
+
+UPSERT_STATE = """
+insert into bot.chat_state (chat_id, state_code) values ({chat_id}, {state_code})
+""" + ON_STATE_CONFLICT.lstrip("\n")
+
+# Обновляет только изменённые и удалённые ключи контекста, не перезаписывая документ целиком.
+# Для нового чата изменения и есть весь контекст.
+_CONTEXT_CHANGES = """
+updated as (
+    update bot.chat_context as c
+    set context = (c.context - {deleted}) || {changes}
+    where c.chat_id = {chat_id}
+    returning c.chat_id
+)
+insert into bot.chat_context (chat_id, context)
+select {chat_id}, {changes}
+where not exists (select from updated)
+on conflict (chat_id) do update
+set context = (bot.chat_context.context - {deleted}) || excluded.context
+"""
+
+UPSERT_CONTEXT_CHANGES = "with" + _CONTEXT_CHANGES
+
+# То же, что UPSERT_CONTEXT_CHANGES, вместе с состоянием одним выражением.
+UPSERT_SNAPSHOT = "with state as (" + UPSERT_STATE + ")," + _CONTEXT_CHANGES
+
+# Перенос чата из архива обратно в chat_state и chat_context (см. ChatArchiver).
+RESTORE_ARCHIVED = """
+with restored as (
+    delete from bot.chat_archive as a
+    where a.chat_id = {chat_id}
+    returning a.chat_id, a.state_code, a.context
+),
+state as (
+    insert into bot.chat_state (chat_id, state_code)
+    select r.chat_id, r.state_code from restored as r
+    on conflict (chat_id) do nothing
+),
+context as (
+    insert into bot.chat_context (chat_id, context)
+    select r.chat_id, r.context from restored as r where r.context is not null
+    on conflict (chat_id) do nothing
+)
+select r.state_code, r.context from restored as r
+"""
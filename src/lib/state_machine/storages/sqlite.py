@@ -1,18 +1,21 @@
-import json
 import sqlite3
 from textwrap import dedent
 
-from .base import StateMachineStorage, Context, ChatId
+from ...codecs import ContextCodec, JsonCodec, decode_any, detect_codec
+from .base import StateMachineStorage, Context, ChatId, ChatSnapshot
 from ..state_machine import StateCode
 
 
-sqlite3.register_adapter(dict, json.dumps)
-sqlite3.register_converter("json", json.loads)
-
-
 class SQLiteInMemoryStorage(StateMachineStorage):
-    def __init__(self, db_path: str = ":memory:"):
-        self._conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+    """
+    Хранилище в SQLite. Контекст сериализуется кодеком codec; строки, записанные другим кодеком
+    (в том числе JSON-текст прежних версий), читаются как есть и перезаписываются при следующем изменении
+    или вызовом migrate_codec.
+    """
+
+    def __init__(self, db_path: str = ":memory:", codec: ContextCodec = JsonCodec()):
+        self._codec = codec
+        self._conn = sqlite3.connect(db_path)
         self._conn.row_factory = sqlite3.Row
         self._create_state_table()  # if not exist
         self._create_context_table()
@@ -33,16 +36,60 @@ class SQLiteInMemoryStorage(StateMachineStorage):
     async def get_context(self, chat_id: ChatId) -> Context | None:
         query = "select context from chat_context where chat_id = :chat_id"
         record = self._conn.execute(query, {"chat_id": chat_id}).fetchone()
-        return record["context"] if record is not None else None
+        return Context(decode_any(record["context"])) if record is not None else None
 
     async def set_context(self, chat_id: ChatId, context: Context) -> None:
+        if not context.is_dirty:
+            return
         query = dedent("""
             insert into chat_context (chat_id, context) values (:chat_id, :context)
-            on conflict(chat_id) do update 
-            set context =: context;
+            on conflict(chat_id) do update
+            set context = excluded.context;
         """)
-        self._conn.execute(query, {"chat_id": chat_id, "context": context})
+        self._conn.execute(query, {"chat_id": chat_id, "context": self._codec.encode(context)})
         self._conn.commit()
+        context.mark_clean()
+
+    async def get_snapshot(self, chat_id: ChatId) -> ChatSnapshot:
+        query = dedent("""
+            select s.state_name, c.context
+            from (select :chat_id as chat_id) as k
+                left join chat_state as s on s.chat_id = k.chat_id
+                left join chat_context as c on c.chat_id = k.chat_id
+        """)
+        record = self._conn.execute(query, {"chat_id": chat_id}).fetchone()
+        context = record["context"]
+        return ChatSnapshot(record["state_name"], Context(decode_any(context)) if context is not None else Context())
+
+    async def set_snapshot(self, chat_id: ChatId, snapshot: ChatSnapshot) -> None:
+        state_query = dedent("""
+            insert into chat_state (chat_id, state_name) values (:chat_id, :state_name)
+            on conflict (chat_id) do update set state_name = excluded.state_name;
+        """)
+        context_query = dedent("""
+            insert into chat_context (chat_id, context) values (:chat_id, :context)
+            on conflict(chat_id) do update
+            set context = excluded.context;
+        """)
+        with self._conn:
+            if snapshot.state_code is not None:
+                self._conn.execute(state_query, {"chat_id": chat_id, "state_name": snapshot.state_code})
+            if snapshot.context.is_dirty:
+                context = self._codec.encode(snapshot.context)
+                self._conn.execute(context_query, {"chat_id": chat_id, "context": context})
+        snapshot.context.mark_clean()
+
+    async def migrate_codec(self) -> int:
+        """Перезаписать контексты, сохранённые другим кодеком. Возвращает количество перезаписанных строк."""
+        query = "update chat_context set context = :context where chat_id = :chat_id"
+        migrated = 0
+        with self._conn:
+            for record in self._conn.execute("select chat_id, context from chat_context").fetchall():
+                if detect_codec(record["context"]).name != self._codec.name:
+                    context = self._codec.encode(decode_any(record["context"]))
+                    self._conn.execute(query, {"chat_id": record["chat_id"], "context": context})
+                    migrated += 1
+        return migrated
 
     def _create_context_table(self) -> None:
         query = dedent("""
@@ -0,0 +1,137 @@
+import asyncio
+import sqlite3
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from textwrap import dedent
+
+from ...codecs import ContextCodec, JsonCodec, decode_any, detect_codec
+from .base import StateMachineStorage, Context, ChatId, ChatSnapshot
+from ..state_machine import StateCode
+
+T = typing.TypeVar("T")
+
+
+class AsyncSQLiteStorage(StateMachineStorage):
+    """
+    Хранилище в SQLite, не блокирующее цикл событий.
+    Все запросы выполняются в отдельном потоке, база работает в режиме WAL, а записи разных чатов,
+    сделанные за commit_interval секунд, фиксируются одной транзакцией. Методы записи возвращают
+    управление после фиксации.
+
+    Контекст сериализуется кодеком codec. Строки, записанные другим кодеком, читаются как есть
+    и перезаписываются при следующем изменении или вызовом migrate_codec.
+    """
+
+    def __init__(self, db_path: str = ":memory:", commit_interval: float = 0.01, codec: ContextCodec = JsonCodec()):
+        self._codec = codec
+        self._commit_interval = commit_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-storage")
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("pragma journal_mode = wal")
+        self._conn.execute("pragma synchronous = normal")
+        self._create_chat_table()  # if not exist
+        self._pending_commit: asyncio.Future | None = None
+
+    async def get_state(self, chat_id: ChatId) -> StateCode | None:
+        return (await self.get_snapshot(chat_id)).state_code
+
+    async def set_state(self, chat_id: ChatId, state_name: str) -> None:
+        await self._write(self._upsert, chat_id, state_name, None)
+
+    async def get_context(self, chat_id: ChatId) -> Context | None:
+        record = await self._run(self._select, chat_id)
+        if record is None or record["context"] is None:
+            return None
+        return Context(decode_any(record["context"]))
+
+    async def set_context(self, chat_id: ChatId, context: Context) -> None:
+        if not context.is_dirty:
+            return
+        await self._write(self._upsert, chat_id, None, self._codec.encode(context))
+        context.mark_clean()
+
+    async def get_snapshot(self, chat_id: ChatId) -> ChatSnapshot:
+        record = await self._run(self._select, chat_id)
+        if record is None:
+            return ChatSnapshot(None, Context())
+        context = Context(decode_any(record["context"])) if record["context"] is not None else Context()
+        return ChatSnapshot(record["state_code"], context)
+
+    async def set_snapshot(self, chat_id: ChatId, snapshot: ChatSnapshot) -> None:
+        context = self._codec.encode(snapshot.context) if snapshot.context.is_dirty else None
+        if snapshot.state_code is None and context is None:
+            return
+        await self._write(self._upsert, chat_id, snapshot.state_code, context)
+        snapshot.context.mark_clean()
+
+    async def close(self) -> None:
+        """Зафиксировать незавершённую транзакцию и закрыть соединение."""
+        await self._run(self._conn.commit)
+        await self._run(self._conn.close)
+        self._executor.shutdown()
+
+    async def migrate_codec(self) -> int:
+        """Перезаписать контексты, сохранённые другим кодеком. Возвращает количество перезаписанных строк."""
+        migrated = await self._run(self._migrate_codec)
+        await self._run(self._conn.commit)
+        return migrated
+
+    async def _run(self, func: typing.Callable[..., T], *args) -> T:
+        """Выполнить функцию в потоке базы данных."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _write(self, func: typing.Callable[..., typing.Any], *args) -> None:
+        """Выполнить запись и дождаться групповой фиксации транзакции."""
+        await self._run(func, *args)
+        if self._pending_commit is None:
+            loop = asyncio.get_running_loop()
+            self._pending_commit = loop.create_future()
+            loop.call_later(self._commit_interval, self._start_commit)
+        await asyncio.shield(self._pending_commit)
+
+    def _start_commit(self) -> None:
+        waiter, self._pending_commit = self._pending_commit, None
+        commit = asyncio.ensure_future(self._run(self._conn.commit))
+
+        def resolve(task: asyncio.Future) -> None:
+            if task.exception() is not None:
+                waiter.set_exception(task.exception())
+            else:
+                waiter.set_result(None)
+
+        commit.add_done_callback(resolve)
+
+    def _migrate_codec(self) -> int:
+        migrated = 0
+        for record in self._conn.execute("select chat_id, context from chat where context is not null").fetchall():
+            if detect_codec(record["context"]).name != self._codec.name:
+                context = self._codec.encode(decode_any(record["context"]))
+                self._upsert(record["chat_id"], None, context)
+                migrated += 1
+        return migrated
+
+    def _select(self, chat_id: ChatId) -> sqlite3.Row | None:
+        query = "select state_code, context from chat where chat_id = :chat_id"
+        return self._conn.execute(query, {"chat_id": chat_id}).fetchone()
+
+    def _upsert(self, chat_id: ChatId, state_code: str | None, context: bytes | None) -> None:
+        """Записать состояние и/или контекст. Не переданные (None) значения не изменяются."""
+        query = dedent("""
+            insert into chat (chat_id, state_code, context) values (:chat_id, :state_code, :context)
+            on conflict (chat_id) do update
+            set state_code = coalesce(excluded.state_code, state_code),
+                context    = coalesce(excluded.context, context);
+        """)
+        self._conn.execute(query, {"chat_id": chat_id, "state_code": state_code, "context": context})
+
+    def _create_chat_table(self) -> None:
+        query = dedent("""
+            create table if not exists chat (
+                chat_id    INTEGER PRIMARY KEY,
+                state_code TEXT,
+                context    BLOB
+            );
+        """)
+        self._conn.execute(query)
+        self._conn.commit()
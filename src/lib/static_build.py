@@ -0,0 +1,185 @@
+"""
+Сборка статики: изображения уменьшаются до размеров, которые показывает Telegram, и пережимаются,
+а манифест сопоставляет код файла с оптимизированным файлом и хешем его содержимого.
+
+StaticLoader с манифестом отправляет оптимизированные файлы вместо исходных и не хеширует их при запуске.
+Код файла – путь исходника относительно корня статики без расширения (images/1.png -> images/1).
+Неизменившиеся исходники повторно не обрабатываются, пока не изменились --max-side и --jpeg-quality.
+Если пережатый файл не меньше исходного, манифест указывает на исходник.
+
+    python -m src.lib.static_build --root static --sql files.sql
+
+Требуется необязательная зависимость Pillow.
+"""
+import argparse
+import hashlib
+import io
+import sys
+from pathlib import Path
+
+from pydantic import BaseModel
+
+# Telegram показывает фото не больше 1280 пикселей по длинной стороне (2560 – для фото в высоком качестве).
+DEFAULT_MAX_SIDE = 1280
+DEFAULT_JPEG_QUALITY = 85
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp")
+
+
+class ManifestEntry(BaseModel):
+    source: str  # путь исходника относительно корня статики
+    source_hash: str
+    source_bytes: int
+    path: str  # путь оптимизированного файла (или исходника, если пережатие не помогло) относительно корня статики
+    content_hash: str  # sha256 оптимизированного файла, как в file_telegram_ids.content_hash
+    bytes: int
+    # Параметры сборки: при их изменении файл собирается заново
+    max_side: int | None = None
+    jpeg_quality: int | None = None
+
+
+class StaticManifest(BaseModel):
+    files: dict[str, ManifestEntry] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "StaticManifest":
+        return cls.model_validate_json(path.read_bytes()) if path.exists() else cls()
+
+    def save(self, path: Path) -> None:
+        path.write_text(self.model_dump_json(indent=2))
+
+    def by_source(self) -> dict[str, ManifestEntry]:
+        """Записи по пути исходника – для строк таблицы files, указывающих на исходные файлы."""
+        return {entry.source: entry for entry in self.files.values()}
+
+
+def load_manifest(path: Path | None) -> StaticManifest | None:
+    """Загрузить манифест, если путь задан."""
+    return StaticManifest.load(path) if path is not None else None
+
+
+def optimize_image(data: bytes, max_side: int, jpeg_quality: int) -> tuple[bytes, str]:
+    """
+    Уменьшить изображение до max_side по длинной стороне и пережать.
+    Непрозрачные изображения сохраняются в JPEG (Telegram всё равно хранит фото в JPEG), прозрачные – в PNG.
+    Возвращает содержимое и расширение файла.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        if image.mode in ("RGBA", "LA") and image.getchannel("A").getextrema()[0] == 255:
+            image = image.convert("RGB")  # альфа-канал есть, но изображение непрозрачно
+        elif image.mode == "P" and "transparency" not in image.info:
+            image = image.convert("RGB")
+
+        output = io.BytesIO()
+        if image.mode in ("RGB", "L"):
+            image.save(output, "JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+            return output.getvalue(), ".jpg"
+        image.save(output, "PNG", optimize=True)
+        return output.getvalue(), ".png"
+
+
+def build(root: Path, output_dir: str, manifest: StaticManifest, max_side: int, jpeg_quality: int) -> StaticManifest:
+    """Собрать изображения из root в root / output_dir. Записи манифеста неизменившихся исходников сохраняются."""
+    files: dict[str, ManifestEntry] = {}
+    for source in sorted(root.rglob("*")):
+        relative = source.relative_to(root)
+        if source.suffix.lower() not in IMAGE_SUFFIXES or relative.parts[0] == output_dir:
+            continue
+        code = relative.with_suffix("").as_posix()
+        data = source.read_bytes()
+        source_hash = hashlib.sha256(data).hexdigest()
+
+        previous = manifest.files.get(code)
+        if (
+            previous is not None
+            and previous.source_hash == source_hash
+            and (previous.max_side, previous.jpeg_quality) == (max_side, jpeg_quality)
+            and (root / previous.path).exists()
+        ):
+            files[code] = previous
+            continue
+
+        optimized, suffix = optimize_image(data, max_side, jpeg_quality)
+        if len(optimized) >= len(data):
+            # Пережатие не помогло – отправлять исходник, в каком бы формате ни был результат
+            optimized, target = data, relative
+        else:
+            target = Path(output_dir) / relative.with_suffix(suffix)
+            (root / target).parent.mkdir(parents=True, exist_ok=True)
+            (root / target).write_bytes(optimized)
+        files[code] = ManifestEntry(
+            source=relative.as_posix(),
+            source_hash=source_hash,
+            source_bytes=len(data),
+            path=target.as_posix(),
+            content_hash=hashlib.sha256(optimized).hexdigest(),
+            bytes=len(optimized),
+            max_side=max_side,
+            jpeg_quality=jpeg_quality,
+        )
+    return StaticManifest(files=files)
+
+
+def report(manifest: StaticManifest) -> str:
+    """Сэкономленные байты по каждому файлу и всего."""
+    lines = []
+    for code, entry in manifest.files.items():
+        saved = entry.source_bytes - entry.bytes
+        lines.append(
+            f"{code:<24} {entry.source_bytes:>10} -> {entry.bytes:>10} байт"
+            f"  −{saved:>10} ({saved / entry.source_bytes:6.1%})"
+        )
+    source_total = sum(entry.source_bytes for entry in manifest.files.values())
+    total = sum(entry.bytes for entry in manifest.files.values())
+    if source_total:
+        saved = source_total - total
+        lines.append(
+            f"{'всего':<24} {source_total:>10} -> {total:>10} байт  −{saved:>10} ({saved / source_total:6.1%})"
+        )
+    return "\n".join(lines)
+
+
+def files_upsert_sql(manifest: StaticManifest) -> str:
+    """SQL, записывающий оптимизированные файлы в таблицу files."""
+    rows = ",\n".join(
+        f"    ('{_quote(code)}', '{_quote(entry.path)}')" for code, entry in sorted(manifest.files.items())
+    )
+    if not rows:
+        return ""
+    return f"insert into files (code, path)\nvalues\n{rows}\non conflict (code) do update set path = excluded.path;\n"
+
+
+def _quote(value: str) -> str:
+    return value.replace("'", "''")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", type=Path, default=Path("static"), help="корень статики")
+    parser.add_argument("--output-dir", default="optimized", help="каталог результата внутри корня статики")
+    parser.add_argument("--manifest", type=Path, help="путь к манифесту, по умолчанию <root>/manifest.json")
+    parser.add_argument("--max-side", type=int, default=DEFAULT_MAX_SIDE)
+    parser.add_argument("--jpeg-quality", type=int, default=DEFAULT_JPEG_QUALITY)
+    parser.add_argument("--sql", type=Path, help="записать SQL для обновления таблицы files")
+    args = parser.parse_args()
+
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        sys.exit("Для сборки статики требуется пакет Pillow")
+
+    manifest_path = args.manifest or args.root / "manifest.json"
+    manifest = build(args.root, args.output_dir, StaticManifest.load(manifest_path), args.max_side, args.jpeg_quality)
+    manifest.save(manifest_path)
+    print(report(manifest))
+    if args.sql is not None:
+        args.sql.write_text(files_upsert_sql(manifest))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,281 @@
+import asyncio
+import hashlib
+import json
+import logging
+import typing
+from contextlib import nullcontext
 from pathlib import Path
 
-from aiogram.types import InputFile, FSInputFile
-from databases import Database
+import asyncpg
+from aiogram.methods import SendPhoto
+from aiogram.types import InputFile, FSInputFile, Message
+
+from .metrics import Histogram, Registry
+from .static_build import ManifestEntry, StaticManifest
+
+if typing.TYPE_CHECKING:
+    from .outbox import Outbox
+
+logger = logging.getLogger(__name__)
+
+# Канал, в который триггеры таблиц texts и files отправляют коды изменённых строк (см. init_database.sql).
+STATIC_CHANGED_CHANNEL = "static_changed"
+
+# Пауза перед переподключением listen в секундах: удваивается после каждой неудачи до максимума
+_LISTEN_RETRY_DELAY = 1.0
+_LISTEN_MAX_RETRY_DELAY = 60.0
+
+_GET_TEXT = "select t.text from texts as t where t.code = $1"
+
+_GET_FILE_PATH = "select i.path from files as i where i.code = $1"
+
+_GET_FILE_ID = "select f.content_hash, f.file_id from file_telegram_ids as f where f.code = $1"
+
+_UPSERT_FILE_ID = """
+insert into file_telegram_ids (code, content_hash, file_id) values ($1, $2, $3)
+on conflict (code) do update set content_hash = excluded.content_hash, file_id = excluded.file_id
+"""
 
 
 class StaticLoader:
-    """Загрузчик статических данных."""
+    """
+    Загрузчик статических данных.
+    После preload отдаёт тексты и пути к файлам из памяти, а listen поддерживает их в актуальном состоянии.
+    Файл, уже загруженный в Telegram, отдаётся как file_id, пока его содержимое на диске не изменится;
+    send_photo запоминает file_id после первой загрузки сам.
+    С манифестом сборки статики (см. static_build) вместо исходных изображений отправляются оптимизированные.
+    """
 
-    def __init__(self, db: Database, default_text: str, default_image_path: str, static_root: Path) -> None:
-        self._db = db
+    def __init__(
+        self,
+        pool: asyncpg.Pool,
+        default_text: str,
+        default_image_path: str,
+        static_root: Path,
+        query_duration: Histogram | None = None,
+        manifest: StaticManifest | None = None,
+    ) -> None:
+        self._pool = pool
+        self._query_duration = query_duration
         self._static_root = static_root
         self._default_text = default_text
         self._default_image_path = default_image_path
+        self._texts: dict[str, str] | None = None
+        self._file_paths: dict[str, str] | None = None
+        self._file_ids: dict[str, tuple[str, str]] = {}  # код -> (хеш содержимого, file_id)
+        self._content_hashes: dict[Path, tuple[int, int, str]] = {}  # путь -> (mtime, размер, хеш)
+        # В таблице files может быть как путь исходника, так и путь оптимизированного файла.
+        self._manifest: dict[str, ManifestEntry] = {}
+        if manifest is not None:
+            self._manifest = {**manifest.by_source(), **{entry.path: entry for entry in manifest.files.values()}}
+        self._refresh_tasks: set[asyncio.Task] = set()
+        self._remember_tasks: set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
 
     async def get_text(self, code: str) -> str:
         """Получить текст по коду."""
-        stmt = "select t.text from texts as t where t.code = :code"
-        text = await self._db.fetch_val(stmt, {"code": code})
+        text = self._texts.get(code) if self._texts is not None else None
+        if text is not None:
+            self.hits += 1
+            return text
+        self.misses += 1
+
+        if self._texts is None:
+            with self._timed("text"):
+                text = await self._pool.fetchval(_GET_TEXT, code)
         if text is None:
             return self._default_text
         return text
 
-    async def get_file(self, code: str) -> InputFile:
-        """Получить файл по коду."""
-        stmt = "select i.path from files as i where i.code = :code"
-        image_path: str = await self._db.fetch_val(stmt, {"code": code})
-        if image_path is None:
-            return InputFile(self._default_image_path)
+    async def get_file(self, code: str) -> InputFile | str:
+        """
+        Получить файл по коду.
+        Возвращает file_id, если файл с таким же содержимым уже был отправлен (см. remember_file_id).
+        """
+        file = await self._get_file(code)
+        if file is None:
+            return FSInputFile(self._default_image_path)
 
-        file_path = self._static_root / image_path
+        file_path, content_hash = file
+        file_id = await self._get_file_id(code, content_hash)
+        if file_id is not None:
+            return file_id
         return FSInputFile(file_path.absolute(), filename=file_path.name)
+
+    async def send_photo(self, outbox: "Outbox", chat_id: int, code: str, **kwargs) -> asyncio.Future[Message]:
+        """
+        Поставить в очередь outbox отправку изображения с кодом code.
+        Если файл загружается в Telegram впервые, его file_id запоминается, когда сообщение будет отправлено.
+        """
+        photo = await self.get_file(code)
+        sent = outbox.send(chat_id, SendPhoto(chat_id=chat_id, photo=photo, **kwargs))
+        if not isinstance(photo, str):
+            task = asyncio.create_task(self._remember_sent(code, sent))
+            self._remember_tasks.add(task)
+            task.add_done_callback(self._remember_tasks.discard)
+        return sent
+
+    async def remember_file_id(self, code: str, message: Message) -> None:
+        """Запомнить file_id, присвоенный Telegram файлу с кодом code при отправке сообщения message."""
+        file_id = _sent_file_id(message)
+        file = await self._get_file(code, counted=False)
+        if file_id is None or file is None:
+            return
+
+        _, content_hash = file
+        if self._file_ids.get(code) == (content_hash, file_id):
+            return
+        await self._pool.execute(_UPSERT_FILE_ID, code, content_hash, file_id)
+        self._file_ids[code] = (content_hash, file_id)
+
+    async def _remember_sent(self, code: str, sent: asyncio.Future[Message]) -> None:
+        try:
+            message = await sent
+        except Exception:
+            return  # ошибку отправки уже записал Outbox
+        await self.remember_file_id(code, message)
+
+    async def _get_file(self, code: str, counted: bool = True) -> tuple[Path, str] | None:
+        """
+        Путь к файлу и хеш его содержимого. Если файл есть в манифесте сборки статики,
+        возвращается оптимизированный файл с хешем из манифеста.
+        """
+        image_path = await self._get_file_path(code, counted)
+        if image_path is None:
+            return None
+        if (entry := self._manifest.get(image_path)) is not None:
+            return self._static_root / entry.path, entry.content_hash
+        file_path = self._static_root / image_path
+        return file_path, await self._content_hash(file_path)
+
+    async def _get_file_path(self, code: str, counted: bool = True) -> str | None:
+        """
+        Путь к файлу из таблицы files, относительно корня статики.
+        counted=False – служебное обращение, не учитываемое в hits и misses.
+        """
+        image_path = self._file_paths.get(code) if self._file_paths is not None else None
+        if counted:
+            if image_path is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if image_path is None and self._file_paths is None:
+            with self._timed("file"):
+                image_path = await self._pool.fetchval(_GET_FILE_PATH, code)
+        return image_path
+
+    async def _get_file_id(self, code: str, content_hash: str) -> str | None:
+        if code not in self._file_ids and self._file_paths is None:
+            with self._timed("file_id"):
+                record = await self._pool.fetchrow(_GET_FILE_ID, code)
+            if record is not None:
+                self._file_ids[code] = (record["content_hash"], record["file_id"])
+        known_hash, file_id = self._file_ids.get(code, (None, None))
+        return file_id if known_hash == content_hash else None
+
+    async def _content_hash(self, file_path: Path) -> str:
+        """Хеш содержимого файла. Пересчитывается, только если изменились время изменения или размер."""
+        stat = await asyncio.to_thread(file_path.stat)
+        cached = self._content_hashes.get(file_path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        content_hash = await asyncio.to_thread(_file_sha256, file_path)
+        self._content_hashes[file_path] = (stat.st_mtime_ns, stat.st_size, content_hash)
+        return content_hash
+
+    def _timed(self, kind: str) -> typing.ContextManager[None]:
+        """Измерить длительность запроса к базе данных, если метрики включены."""
+        if self._query_duration is None:
+            return nullcontext()
+        return self._query_duration.time(kind)
+
+    async def preload(self) -> None:
+        """Загрузить все тексты и пути к файлам в память."""
+        async with self._pool.acquire() as connection:
+            texts = await connection.fetch("select t.code, t.text from texts as t")
+            files = await connection.fetch("select i.code, i.path from files as i")
+            file_ids = await connection.fetch("select f.code, f.content_hash, f.file_id from file_telegram_ids as f")
+        self._texts = {r["code"]: r["text"] for r in texts}
+        self._file_paths = {r["code"]: r["path"] for r in files}
+        self._file_ids = {r["code"]: (r["content_hash"], r["file_id"]) for r in file_ids}
+        logger.info("Загружено текстов: %d, файлов: %d", len(self._texts), len(self._file_paths))
+
+    async def listen(self) -> None:
+        """
+        Обновлять загруженные данные по уведомлениям базы данных, пока задача не будет отменена.
+        Потерянное соединение восстанавливается с нарастающей паузой, после чего данные перечитываются целиком:
+        уведомления, отправленные без соединения, не доставляются.
+        """
+        delay = _LISTEN_RETRY_DELAY
+        connected = False
+        while True:
+            try:
+                async with self._pool.acquire() as connection:
+                    lost = asyncio.Event()
+
+                    def on_lost(_: asyncpg.Connection) -> None:
+                        lost.set()
+
+                    connection.add_termination_listener(on_lost)
+                    await connection.add_listener(STATIC_CHANGED_CHANNEL, self._on_notification)
+                    try:
+                        if connected and self._texts is not None:
+                            await self.preload()
+                        connected, delay = True, _LISTEN_RETRY_DELAY
+                        await lost.wait()
+                    finally:
+                        connection.remove_termination_listener(on_lost)
+                        if not connection.is_closed():
+                            await connection.remove_listener(STATIC_CHANGED_CHANNEL, self._on_notification)
+                logger.warning("Соединение для уведомлений об изменении статики потеряно")
+            except Exception:
+                logger.exception("Не удалось подписаться на уведомления об изменении статики")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _LISTEN_MAX_RETRY_DELAY)
+
+    def _on_notification(self, connection: asyncpg.Connection, pid: int, channel: str, payload: str) -> None:
+        notification = json.loads(payload)
+        task = asyncio.create_task(self._refresh(notification["table"], notification["code"]))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _refresh(self, table: str, code: str) -> None:
+        """Перечитать одну изменённую строку."""
+        if table == "texts" and self._texts is not None:
+            stmt, cache = _GET_TEXT, self._texts
+        elif table == "files" and self._file_paths is not None:
+            stmt, cache = _GET_FILE_PATH, self._file_paths
+        else:
+            return
+        value = await self._pool.fetchval(stmt, code)
+        if value is None:
+            cache.pop(code, None)
+        else:
+            cache[code] = value
+        logger.info("Обновлены статические данные %s «%s»", table, code)
+
+
+def static_query_histogram(registry: Registry) -> Histogram:
+    """Гистограмма длительности запросов StaticLoader к базе данных."""
+    histogram = Histogram("bot_static_query_duration_seconds", "Длительность запроса статических данных", ["kind"])
+    registry.register(histogram)
+    return histogram
+
+
+def _file_sha256(file_path: Path) -> str:
+    digest = hashlib.sha256()
+    with file_path.open("rb") as file:
+        while chunk := file.read(1 << 16):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _sent_file_id(message: Message) -> str | None:
+    """file_id файла из отправленного сообщения."""
+    if message.photo:
+        return message.photo[-1].file_id
+    for media in (message.document, message.animation, message.video, message.audio, message.sticker):
+        if media is not None:
+            return media.file_id
+    return None
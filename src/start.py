@@ -1,31 +1,247 @@
 import asyncio
+import importlib.util
 import logging
 import sys
+import time
+import typing
 
 from aiogram import Dispatcher, Bot
+from aiohttp import web
+from dependency_injector import providers
 from dependency_injector.wiring import inject, Provide
 
-from src.lib.state_machine import StateMachine
+from src.config import CacheConfig, MetricsConfig, RuntimeConfig, StaticConfig, TelegramBotConfig, WebhookConfig
+from src.lib.metrics import Gauge, Registry, serve_metrics
+from src.lib.outbox import Outbox
+from src.lib.readiness import Readiness
+from src.lib.recorder import TrafficRecorder
+from src.lib.state_machine.scheduler import ChatScheduler
+from src.lib.state_machine import StateMachineStorage
+from src.lib.state_machine.archiver import ChatArchiver
+from src.lib.static_loader import StaticLoader
 from src.container import Container
 
+logger = logging.getLogger(__name__)
 
-@inject
-async def start_bot(bot: Bot = Provide["bot.client"], state_machine: StateMachine = Provide["state_machine"]) -> None:
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+# Модули с внедрением зависимостей
+WIRED_MODULES = [
+    __name__,
+    "src.lib.state_machine.mixins",
+]
+
+# Пакеты обработчиков и состояний бота. wire импортирует все их модули, поэтому это делается при запуске,
+# а не при импорте; отсутствующий пакет пропускается.
+WIRED_PACKAGES = [
+    "src.bot.handlers",
+]
+
+
+def make_dispatcher(
+    scheduler: ChatScheduler,
+    outbox: Outbox,
+    recorder: TrafficRecorder | None = None,
+) -> Dispatcher:
     dp = Dispatcher()
-    dp.message()(state_machine.handle_action)
-    dp.callback_query()(state_machine.handle_action)
-    await dp.start_polling(bot, allowed_updates=["message", "callback_query"])
+    dp.shutdown.register(outbox.close)
+    if recorder is not None:
+        dp.update.outer_middleware(recorder.middleware)
+        dp.shutdown.register(recorder.close)
+    dp.message()(scheduler.handle_action)
+    dp.callback_query()(scheduler.handle_action)
+    return dp
+
+
+async def start_polling(bot: Bot, dp: Dispatcher) -> None:
+    await dp.start_polling(bot, allowed_updates=ALLOWED_UPDATES)
+
+
+async def start_webhook(bot: Bot, dp: Dispatcher, config: WebhookConfig, readiness: Readiness) -> None:
+    """
+    Принимать обновления через вебхук. Telegram получает ответ сразу, обновление обрабатывается в фоне.
+    Если url не задан, вебхук не регистрируется – так сервер можно проверить локально,
+    отправляя POST-запросы с JSON обновления и заголовком X-Telegram-Bot-Api-Secret-Token.
+    """
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.secret_token,
+        handle_in_background=True,
+    ).register(app, path=config.path)
+    setup_application(app, dp, bot=bot)
+    app.router.add_get("/ready", readiness.handle)
+
+    if config.url is not None:
+        await bot.set_webhook(
+            config.url.rstrip("/") + config.path,
+            secret_token=config.secret_token,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, config.host, config.port).start()
+        readiness.set()
+        await asyncio.Future()
+    finally:
+        readiness.clear()
+        await runner.cleanup()
+
+
+@inject
+async def warm_up(
+    bot: Bot = Provide["bot.client"],
+    static: StaticConfig | None = Provide["config.provided.static"],
+    static_loader: providers.Provider[StaticLoader] = Provide["static_loader.provider"],
+    background: set[asyncio.Task] = Provide["background_tasks"],
+) -> None:
+    """
+    Подготовиться к первому обновлению до начала приёма: открыть HTTP-сессию бота и загрузить статику,
+    чтобы первые пользователи не ждали холодного старта. Пул соединений уже открыт внедрением StateMachine.
+    """
+    started = time.perf_counter()
+    await bot.get_me()
+    if static is not None:
+        loader = await static_loader()
+        await loader.preload()
+        task = asyncio.create_task(loader.listen())
+        background.add(task)
+        task.add_done_callback(background.discard)
+    logger.info("Прогрев завершён за %.2f с", time.perf_counter() - started)
+
+
+@inject
+async def start_maintenance(
+    archiver: ChatArchiver | None = Provide["archiver"],
+    background: set[asyncio.Task] = Provide["background_tasks"],
+) -> None:
+    """Запустить фоновое обслуживание таблиц чатов, если оно включено. Достаточно одного процесса."""
+    if archiver is None:
+        return
+    task = asyncio.create_task(archiver.run())
+    background.add(task)
+    task.add_done_callback(background.discard)
+
+
+@inject
+async def start_metrics(
+    port_offset: int = 0,
+    config: MetricsConfig = Provide["config.provided.metrics"],
+    registry: Registry = Provide["metrics"],
+    scheduler: ChatScheduler = Provide["scheduler"],
+    outbox: Outbox = Provide["bot.outbox"],
+    db_pool_gauge: Gauge = Provide["db_pool_gauge"],
+    storage: StateMachineStorage = Provide["storage"],
+    cache: CacheConfig = Provide["config.provided.cache"],
+    readiness: Readiness = Provide["readiness"],
+    archiver: ChatArchiver | None = Provide["archiver"],
+) -> web.AppRunner | None:
+    """Запустить HTTP-сервер /metrics, если метрики включены."""
+    if config.mode == "off":
+        return None
+    registry.register(db_pool_gauge)
+    registry.register(
+        Gauge(
+            "bot_scheduler_active_chats",
+            "Чаты с обрабатываемыми или ожидающими действиями",
+            callback=lambda: {(): scheduler.active_chats},
+        )
+    )
+    registry.register(
+        Gauge(
+            "bot_outbox_queue_depth",
+            "Исходящие сообщения, ожидающие отправки",
+            ["priority"],
+            callback=lambda: {(priority.name.lower(),): depth for priority, depth in outbox.queue_depth.items()},
+        )
+    )
+    if archiver is not None:
+        archiver.register_metrics(registry)
+    if cache.mode == "on":  # storage – CachedStorage
+        registry.register(
+            Gauge(
+                "bot_storage_cache",
+                "Обращения к кешу чатов (hits, misses, evictions, expirations) и его размер (chats, bytes)",
+                ["stat"],
+                callback=lambda: {(name,): value for name, value in storage.stats().items()},
+            )
+        )
+    return await serve_metrics(registry, config.host, config.port + port_offset, ready_handler=readiness.handle)
+
+
+@inject
+async def start_bot(
+    bot: Bot = Provide["bot.client"],
+    scheduler: ChatScheduler = Provide["scheduler"],
+    config: TelegramBotConfig = Provide["config.provided.bot"],
+    outbox: Outbox = Provide["bot.outbox"],
+    readiness: Readiness = Provide["readiness"],
+    recorder: TrafficRecorder | None = Provide["recorder"],
+) -> None:
+    await warm_up()
+    await start_metrics()
+    await start_maintenance()
+    dp = make_dispatcher(scheduler, outbox, recorder)
+    if config.mode == "webhook":
+        assert config.webhook is not None, "Для режима webhook требуется настройка bot.webhook"
+        await start_webhook(bot, dp, config.webhook, readiness)
+    else:
+        readiness.set()
+        try:
+            await start_polling(bot, dp)
+        finally:
+            readiness.clear()
+
+
+def wire(container: Container) -> None:
+    packages = [package for package in WIRED_PACKAGES if _package_exists(package)]
+    container.wire(modules=WIRED_MODULES, packages=packages)
+
+
+def _package_exists(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:  # нет родительского пакета
+        return False
+
+
+def run(main: typing.Coroutine, config: RuntimeConfig) -> None:
+    """Выполнить корутину в цикле событий, выбранном профилем выполнения."""
+    loop_factory = None
+    if config.event_loop == "uvloop":
+        import uvloop
+
+        loop_factory = uvloop.new_event_loop
+    with asyncio.Runner(debug=config.debug, loop_factory=loop_factory) as runner:
+        runner.run(main)
+
+
+async def with_resources(container: Container, main: typing.Coroutine) -> None:
+    """
+    Выполнить корутину и закрыть ресурсы контейнера, даже если она прервана: сбросить буфер
+    отложенной записи хранилища, закрыть пулы соединений.
+    """
+    try:
+        await main
+    finally:
+        if (shutdown := container.shutdown_resources()) is not None:
+            await shutdown
 
 
 def start():
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 
     container = Container()
-    container.wire(
-        modules=[__name__],
-        packages=[
-            "src.bot.handlers",
-        ],
-    )
+    config = container.config()
+    if config.workers.count > 1:
+        from src.supervisor import supervise
+
+        return supervise(container, config.workers.count)
 
-    asyncio.run(start_bot(), debug=True)
+    wire(container)
+    run(with_resources(container, start_bot()), config.runtime)
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import multiprocessing
+import sys
+import typing
+from multiprocessing.queues import Queue
+
+from aiogram import Bot
+from aiohttp import web
+from dependency_injector.wiring import inject, Provide
+
+from src.config import WebhookConfig
+from src.container import Container
+from src.lib.outbox import Outbox
+from src.lib.readiness import Readiness
+from src.lib.recorder import TrafficRecorder
+from src.lib.state_machine.scheduler import ChatScheduler
+from src.start import (
+    ALLOWED_UPDATES,
+    make_dispatcher,
+    run,
+    start_maintenance,
+    start_metrics,
+    warm_up,
+    wire,
+    with_resources,
+)
+
+logger = logging.getLogger(__name__)
+
+RawUpdate: typing.TypeAlias = dict[str, typing.Any]
+Router: typing.TypeAlias = typing.Callable[[RawUpdate], None]
+
+
+def shard_of(update: RawUpdate, workers: int) -> int:
+    """Номер процесса для обновления. Все обновления одного пользователя попадают в один процесс."""
+    for update_type in ALLOWED_UPDATES:
+        if (event := update.get(update_type)) is not None and "from" in event:
+            return event["from"]["id"] % workers
+    return 0
+
+
+def supervise(container: Container, workers: int) -> None:
+    """
+    Запустить workers процессов-обработчиков и распределять между ними обновления.
+    Каждый процесс создаёт собственные контейнер, пул соединений и StateMachine.
+    """
+    pool = WorkerPool(workers)
+    pool.start()
+    config = container.config()
+    try:
+        if config.bot.mode == "webhook":
+            assert config.bot.webhook is not None, "Для режима webhook требуется настройка bot.webhook"
+            receive = _receive_webhook(container.bot.client(), config.bot.webhook, pool.route)
+        else:
+            receive = _receive_polling(container.bot.client(), pool.route)
+        run(_watched(receive, pool), config.runtime)
+    finally:
+        pool.stop()
+
+
+class WorkerPool:
+    """
+    Процессы-обработчики, у каждого своя очередь обновлений.
+    Упавший процесс перезапускается с новой очередью: очередь могла остаться заблокированной процессом,
+    упавшим во время чтения, поэтому обновления, не прочитанные им, теряются.
+    """
+
+    def __init__(self, workers: int, check_interval: float = 1.0) -> None:
+        self._context = multiprocessing.get_context("spawn")
+        self._check_interval = check_interval
+        self._queues: list[Queue] = [self._context.Queue() for _ in range(workers)]
+        self._processes: list[multiprocessing.Process | None] = [None] * workers
+        self.restarts = 0
+
+    def start(self) -> None:
+        for index in range(len(self._processes)):
+            self._start(index)
+
+    def route(self, update: RawUpdate) -> None:
+        self._queues[shard_of(update, len(self._queues))].put(update)
+
+    async def watch(self) -> None:
+        """Проверять процессы каждые check_interval секунд и перезапускать упавшие, пока задача не отменена."""
+        while True:
+            await asyncio.sleep(self._check_interval)
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive():
+                    logger.error("Процесс %s завершился с кодом %s, перезапуск", process.name, process.exitcode)
+                    self._queues[index] = self._context.Queue()
+                    self._start(index)
+                    self.restarts += 1
+
+    def stop(self) -> None:
+        """Попросить процессы завершиться после уже полученных обновлений и дождаться их."""
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+    def _start(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self._queues[index]),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+
+async def _watched(receive: typing.Coroutine, pool: WorkerPool) -> None:
+    """Получать обновления, пока WorkerPool.watch следит за процессами."""
+    watcher = asyncio.create_task(pool.watch())
+    try:
+        await receive
+    finally:
+        watcher.cancel()
+
+
+async def _receive_polling(bot: Bot, route: Router) -> None:
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=ALLOWED_UPDATES)
+        except Exception:
+            logger.exception("Не удалось получить обновления")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            route(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+            offset = update.update_id + 1
+
+
+async def _receive_webhook(bot: Bot, config: WebhookConfig, route: Router) -> None:
+    async def handle(request: web.Request) -> web.Response:
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != config.secret_token:
+            return web.Response(status=401)
+        route(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(config.path, handle)
+    if config.url is not None:
+        await bot.set_webhook(
+            config.url.rstrip("/") + config.path,
+            secret_token=config.secret_token,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, config.host, config.port).start()
+        await asyncio.Future()
+    finally:
+        await runner.cleanup()
+
+
+def run_worker(index: int, queue: Queue) -> None:
+    """Точка входа процесса-обработчика."""
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format=f"[worker {index}] %(levelname)s:%(message)s")
+
+    container = Container()
+    wire(container)
+    container.wire(modules=[__name__])
+
+    run(with_resources(container, _consume(index, queue)), container.config().runtime)
+
+
+@inject
+async def _consume(
+    index: int,
+    queue: Queue,
+    bot: Bot = Provide["bot.client"],
+    scheduler: ChatScheduler = Provide["scheduler"],
+    outbox: Outbox = Provide["bot.outbox"],
+    readiness: Readiness = Provide["readiness"],
+    recorder: TrafficRecorder | None = Provide["recorder"],
+) -> None:
+    """Обрабатывать обновления из очереди процесса, пока не придёт None."""
+    await warm_up()
+    await start_metrics(port_offset=index)  # у каждого процесса свои метрики на порту metrics.port + index
+    if index == 0:
+        await start_maintenance()
+    dp = make_dispatcher(scheduler, outbox, recorder)
+    readiness.set()
+    loop = asyncio.get_running_loop()
+    handling: set[asyncio.Task] = set()
+    while (update := await loop.run_in_executor(None, queue.get)) is not None:
+        task = asyncio.create_task(dp.feed_raw_update(bot, update))
+        handling.add(task)
+        task.add_done_callback(handling.discard)
+    await asyncio.gather(*handling, return_exceptions=True)
+    await dp.emit_shutdown(bot=bot)
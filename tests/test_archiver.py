@@ -0,0 +1,98 @@
+"""
+Архивация бездействующих чатов на настоящем PostgreSQL.
+Требуется база, созданная init_database.sql, адрес которой задан в TEST_PG_URL; без неё тесты пропускаются.
+ChatArchiver.archive_idle переносит все бездействующие чаты базы, поэтому база должна быть отдельной.
+"""
+import asyncio
+import datetime
+import os
+import typing
+
+import asyncpg
+import pytest
+
+from src.lib.di import asyncpg_init
+from src.lib.state_machine.archiver import ChatArchiver
+from src.lib.state_machine.storages import AsyncpgStateMachineStorage
+from src.lib.state_machine.storages.base import ChatSnapshot, Context
+
+TEST_PG_URL = os.environ.get("TEST_PG_URL")
+
+pytestmark = pytest.mark.skipif(TEST_PG_URL is None, reason="не задан TEST_PG_URL")
+
+CHAT_ID = -4_200_000_001  # отрицательный, чтобы не совпасть с настоящим пользователем
+
+
+async def _prepare_idle_chat(pool: asyncpg.Pool, storage: AsyncpgStateMachineStorage) -> None:
+    await _delete_chat(pool)
+    context = Context()
+    context["answer"] = 1  # изменённый контекст, иначе хранилище его не запишет
+    await storage.set_snapshot(CHAT_ID, ChatSnapshot("before", context))
+    async with pool.acquire() as connection:
+        await connection.execute(
+            "update bot.chat_state set seen_at = current_timestamp - interval '10 days' where chat_id = $1", CHAT_ID
+        )
+
+
+async def _delete_chat(pool: asyncpg.Pool) -> None:
+    async with pool.acquire() as connection:
+        for table in ("chat_state", "chat_context", "chat_archive"):
+            await connection.execute(f"delete from bot.{table} where chat_id = $1", CHAT_ID)
+
+
+async def _is_archived(pool: asyncpg.Pool) -> bool:
+    async with pool.acquire() as connection:
+        return await connection.fetchval("select exists(select from bot.chat_archive where chat_id = $1)", CHAT_ID)
+
+
+Test: typing.TypeAlias = typing.Callable[
+    [asyncpg.Pool, AsyncpgStateMachineStorage, ChatArchiver], typing.Awaitable[None]
+]
+
+
+async def _with_storage(test: Test) -> None:
+    async with asyncpg.create_pool(TEST_PG_URL, min_size=2, max_size=4, init=asyncpg_init) as pool:
+        storage = AsyncpgStateMachineStorage(pool, advisory_lock=True)
+        archiver = ChatArchiver(pool, idle_after=datetime.timedelta(days=1), batch_size=100)
+        await _prepare_idle_chat(pool, storage)
+        try:
+            await test(pool, storage, archiver)
+        finally:
+            await _delete_chat(pool)
+
+
+def test_chat_in_flight_is_not_archived() -> None:
+    async def test(pool: asyncpg.Pool, storage: AsyncpgStateMachineStorage, archiver: ChatArchiver) -> None:
+        async with storage.lock(CHAT_ID):
+            snapshot = await storage.get_snapshot(CHAT_ID)
+            await archiver.archive_idle()
+            assert not await _is_archived(pool)
+            snapshot.state_code = "after"
+            await storage.set_snapshot(CHAT_ID, snapshot)
+
+        snapshot = await storage.get_snapshot(CHAT_ID)
+        assert snapshot.state_code == "after"
+        assert snapshot.context == {"answer": 1}
+        await archiver.archive_idle()
+        assert not await _is_archived(pool), "seen_at должен обновиться после действия"
+
+    asyncio.run(_with_storage(test))
+
+
+def test_idle_chat_is_archived_and_restored() -> None:
+    async def test(pool: asyncpg.Pool, storage: AsyncpgStateMachineStorage, archiver: ChatArchiver) -> None:
+        await archiver.archive_idle()
+        assert await _is_archived(pool)
+
+        async with storage.lock(CHAT_ID):
+            snapshot = await storage.get_snapshot(CHAT_ID)
+            assert snapshot.state_code is None
+            restored = await storage.restore_archived(CHAT_ID)
+
+        assert restored is not None
+        assert restored.state_code == "before"
+        assert restored.context == {"answer": 1}
+        assert not await _is_archived(pool)
+        assert (await storage.get_snapshot(CHAT_ID)).state_code == "before"
+
+    asyncio.run(_with_storage(test))
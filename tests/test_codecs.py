@@ -0,0 +1,32 @@
+import pytest
+
+from src.lib import codecs
+from src.lib.codecs import JsonCodec, MsgpackCodec, decode_any
+from src.lib.state_machine import Context
+
+
+@pytest.fixture(params=["orjson", "json"])
+def json_codec(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> JsonCodec:
+    """JsonCodec с orjson и со стандартным json."""
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(codecs, "orjson", None)
+    return JsonCodec()
+
+
+def test_json_round_trip(json_codec: JsonCodec) -> None:
+    context = Context({"name": "Иван", "answers": [1, 2.5, None, True], "nested": {"a": "b"}})
+    assert json_codec.decode(json_codec.encode(context)) == context.data
+
+
+def test_json_non_str_keys_become_strings(json_codec: JsonCodec) -> None:
+    context = Context({"scores": {1: 10, 2: 20}})
+    assert json_codec.decode(json_codec.encode(context)) == {"scores": {"1": 10, "2": 20}}
+
+
+def test_decode_any_detects_codec() -> None:
+    pytest.importorskip("msgpack")
+    value = {"step": 3}
+    assert decode_any(JsonCodec().encode(value)) == value
+    assert decode_any(MsgpackCodec().encode(value)) == value
@@ -0,0 +1,94 @@
+import asyncio
+import typing
+
+import pytest
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage, TelegramMethod
+
+from src.lib.outbox import Outbox, Priority
+
+
+class FakeBot:
+    """Записывает тексты отправленных сообщений; первые retry_after_calls вызовов отвечают TelegramRetryAfter."""
+
+    def __init__(self, retry_after_calls: int = 0) -> None:
+        self.texts: list[str] = []
+        self._retry_after_calls = retry_after_calls
+
+    async def __call__(self, method: TelegramMethod) -> typing.Any:
+        if self._retry_after_calls:
+            self._retry_after_calls -= 1
+            raise TelegramRetryAfter(method, "Too Many Requests", retry_after=0)
+        assert isinstance(method, SendMessage)
+        self.texts.append(method.text)
+        return method.text
+
+
+def test_chat_messages_are_sent_in_order() -> None:
+    async def test() -> None:
+        bot = FakeBot()
+        outbox = Outbox(bot, chat_rate=1000, chat_burst=1000)  # type: ignore[arg-type]
+        sent = [outbox.send_message(1, f"1-{i}") for i in range(3)] + [outbox.send_message(2, "2-0")]
+        assert await asyncio.gather(*sent) == ["1-0", "1-1", "1-2", "2-0"]
+        assert [text for text in bot.texts if text.startswith("1-")] == ["1-0", "1-1", "1-2"]
+        await outbox.close()
+
+    asyncio.run(test())
+
+
+def test_replies_go_before_bulk() -> None:
+    async def test() -> None:
+        bot = FakeBot()
+        outbox = Outbox(bot)  # type: ignore[arg-type]
+        bulk = outbox.send_message(1, "bulk", priority=Priority.BULK)
+        reply = outbox.send_message(2, "reply")
+        await asyncio.gather(bulk, reply)
+        assert bot.texts == ["reply", "bulk"]
+        await outbox.close()
+
+    asyncio.run(test())
+
+
+def test_buffer_sends_on_exit_and_drops_on_error() -> None:
+    async def test() -> None:
+        bot = FakeBot()
+        outbox = Outbox(bot)  # type: ignore[arg-type]
+        with pytest.raises(RuntimeError):
+            with outbox.buffer():
+                dropped = outbox.send_message(1, "dropped")
+                raise RuntimeError
+        assert dropped.cancelled()
+
+        with outbox.buffer():
+            sent = outbox.send_message(1, "sent")
+            await asyncio.sleep(0.01)
+            assert not bot.texts, "до выхода из буфера ничего не отправляется"
+        assert await sent == "sent"
+        assert bot.texts == ["sent"]
+        await outbox.close()
+
+    asyncio.run(test())
+
+
+def test_retry_after_is_retried() -> None:
+    async def test() -> None:
+        bot = FakeBot(retry_after_calls=1)
+        outbox = Outbox(bot)  # type: ignore[arg-type]
+        assert await outbox.send_message(1, "text") == "text"
+        assert (outbox.retried, outbox.sent) == (1, 1)
+        await outbox.close()
+
+    asyncio.run(test())
+
+
+def test_close_cancels_undelivered() -> None:
+    async def test() -> None:
+        outbox = Outbox(FakeBot(), chat_rate=0.001, chat_burst=1)  # type: ignore[arg-type]
+        first = outbox.send_message(1, "first")
+        second = outbox.send_message(1, "second")  # лимит чата исчерпан первым сообщением
+        await first
+        await outbox.close(timeout=0.05)
+        assert second.cancelled()
+
+    asyncio.run(test())
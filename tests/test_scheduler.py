@@ -0,0 +1,57 @@
+import asyncio
+import datetime
+
+from aiogram.types import Chat, Message, User
+
+from src.lib.state_machine import Action
+from src.lib.state_machine.scheduler import ChatScheduler
+
+
+def make_message(chat_id: int, text: str) -> Message:
+    return Message(
+        message_id=0,
+        date=datetime.datetime.now(),
+        chat=Chat(id=chat_id, type="private"),
+        from_user=User(id=chat_id, is_bot=False, first_name="Test"),
+        text=text,
+    )
+
+
+def test_chat_actions_run_in_order_and_chats_in_parallel() -> None:
+    async def test() -> None:
+        events: list[str] = []
+
+        async def handler(action: Action) -> None:
+            assert isinstance(action, Message)
+            events.append(f"start {action.text}")
+            await asyncio.sleep(0.01)
+            events.append(f"end {action.text}")
+
+        scheduler = ChatScheduler(handler)
+        await asyncio.gather(
+            scheduler.handle_action(make_message(1, "1a")),
+            scheduler.handle_action(make_message(1, "1b")),
+            scheduler.handle_action(make_message(2, "2a")),
+        )
+        assert events.index("end 1a") < events.index("start 1b"), "действия чата не пересекаются"
+        assert events.index("start 2a") < events.index("end 1a"), "чаты обрабатываются параллельно"
+        assert scheduler.active_chats == 0
+
+    asyncio.run(test())
+
+
+def test_max_concurrency() -> None:
+    async def test() -> None:
+        peak = 0
+
+        async def handler(action: Action) -> None:
+            nonlocal peak
+            peak = max(peak, scheduler.in_flight)
+            await asyncio.sleep(0.01)
+
+        scheduler = ChatScheduler(handler, max_concurrency=3)
+        await asyncio.gather(*(scheduler.handle_action(make_message(chat_id, "text")) for chat_id in range(10)))
+        assert peak == 3
+        assert scheduler.in_flight == 0
+
+    asyncio.run(test())
@@ -0,0 +1,140 @@
+import asyncio
+import datetime
+import logging
+import typing
+
+import pytest
+
+from aiogram.methods import AnswerCallbackQuery, TelegramMethod
+from aiogram.types import CallbackQuery, Chat, Message, User
+
+from src.lib.outbox import Outbox
+from src.lib.state_machine import ChatId, Context, State, StateCode, StateMachine
+from src.lib.state_machine.mixins import SwitchStateByMessage
+from src.lib.state_machine.storages import MemoryStorage
+
+CHAT_ID = 1
+
+
+class FakeBot:
+    """Записывает вызванные методы Bot API вместо отправки."""
+
+    def __init__(self) -> None:
+        self.calls: list[TelegramMethod] = []
+
+    async def __call__(self, method: TelegramMethod) -> typing.Any:
+        self.calls.append(method)
+        return True
+
+
+class Menu(State):
+    pass
+
+
+class Alert(State):
+    """Отвечает на обратный вызов сам, всплывающим сообщением."""
+
+    def __init__(self, outbox: Outbox) -> None:
+        self._outbox = outbox
+
+    @property
+    def answers_callback(self) -> bool:
+        return True
+
+    async def callback_handler(self, query: CallbackQuery, chat_id: ChatId, context: Context) -> None:
+        self._outbox.send_now(AnswerCallbackQuery(callback_query_id=query.id, text="Готово", show_alert=True))
+
+
+def make_message(chat_id: int, message_id: int, text: str) -> Message:
+    return Message(
+        message_id=message_id,
+        date=datetime.datetime.now(),
+        chat=Chat(id=chat_id, type="private"),
+        from_user=User(id=chat_id, is_bot=False, first_name="Test"),
+        text=text,
+    )
+
+
+def make_callback_query(query_id: int) -> CallbackQuery:
+    return CallbackQuery(
+        id=str(query_id),
+        from_user=User(id=CHAT_ID, is_bot=False, first_name="Test"),
+        chat_instance=str(CHAT_ID),
+        data="data",
+    )
+
+
+async def handle_callbacks(default_state_code: str, count: int) -> list[AnswerCallbackQuery]:
+    bot = FakeBot()
+    outbox = Outbox(bot)  # type: ignore[arg-type]
+    states = [Menu(), Alert(outbox)]
+    state_machine = StateMachine(states, default_state_code, MemoryStorage(), outbox=outbox)
+    for query_id in range(count):
+        await state_machine.handle_action(make_callback_query(query_id))
+    await outbox.close()
+    return [call for call in bot.calls if isinstance(call, AnswerCallbackQuery)]
+
+
+def test_callback_is_answered_for_handler() -> None:
+    answers = asyncio.run(handle_callbacks("Menu", count=2))
+    assert [answer.callback_query_id for answer in answers] == ["0", "1"]
+    assert all(answer.text is None for answer in answers)
+
+
+def test_state_answering_callback_itself_gets_single_answer() -> None:
+    answers = asyncio.run(handle_callbacks("Alert", count=2))
+    # Первый обратный вызов нового пользователя только переводит его в состояние по умолчанию
+    assert [(answer.callback_query_id, answer.text) for answer in answers] == [("0", None), ("1", "Готово")]
+
+
+class LegacyMenu(SwitchStateByMessage, State):
+    """Переходы, которые известны только из switch_options."""
+
+    switch_options_calls = 0
+
+    async def switch_options(self) -> dict[str, StateCode]:
+        self.switch_options_calls += 1
+        return {"Вперёд": StateCode("Target")}
+
+
+class RoutedMenu(SwitchStateByMessage, State):
+    static_routes = {"Вперёд": StateCode("Target")}
+
+
+class Target(State):
+    pass
+
+
+@pytest.mark.parametrize("menu_code", ["LegacyMenu", "RoutedMenu"])
+def test_switch_state_by_message(menu_code: str) -> None:
+    legacy = LegacyMenu()
+    storage = MemoryStorage()
+    state_machine = StateMachine([legacy, RoutedMenu(), Target()], menu_code, storage)
+
+    async def run(chat_id: int) -> StateCode | None:
+        await state_machine.handle_action(make_message(chat_id, 1, "/start"))
+        await state_machine.handle_action(make_message(chat_id, 2, "Вперёд"))
+        return await storage.get_state(ChatId(chat_id))
+
+    assert [asyncio.run(run(chat_id)) for chat_id in (1, 2, 3)] == ["Target"] * 3
+    assert legacy.switch_options_calls == (1 if menu_code == "LegacyMenu" else 0)
+
+
+class Unreachable(State):
+    pass
+
+
+def test_states_without_declared_transitions_do_not_warn(caplog: pytest.LogCaptureFixture) -> None:
+    with caplog.at_level(logging.WARNING):
+        StateMachine([Menu(), Unreachable()], "Menu", MemoryStorage())
+    assert not caplog.records
+
+
+class Loop(State):
+    transitions = (StateCode("Loop"),)
+
+
+def test_unreachable_state_warns_when_graph_is_declared(caplog: pytest.LogCaptureFixture) -> None:
+    with caplog.at_level(logging.WARNING):
+        StateMachine([Loop(), Unreachable()], "Loop", MemoryStorage())
+    assert "Unreachable" in caplog.text
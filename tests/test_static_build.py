@@ -0,0 +1,48 @@
+import random
+from pathlib import Path
+
+import pytest
+
+from src.lib import static_build
+from src.lib.static_build import StaticManifest, build
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _save_image(path: Path, size: tuple[int, int], noisy: bool) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    image = Image.new("RGB", size, (200, 30, 30))
+    if noisy:
+        rng = random.Random(0)
+        image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(size[0] * size[1])])
+    image.save(path, "PNG")
+
+
+def test_source_is_kept_when_output_is_not_smaller(tmp_path: Path) -> None:
+    _save_image(tmp_path / "images" / "dot.png", (8, 8), noisy=False)  # однотонный PNG меньше любого JPEG
+
+    manifest = build(tmp_path, "optimized", StaticManifest(), max_side=1280, jpeg_quality=85)
+
+    entry = manifest.files["images/dot"]
+    assert entry.path == "images/dot.png"
+    assert entry.bytes == entry.source_bytes
+    assert entry.content_hash == entry.source_hash
+    assert not (tmp_path / "optimized").exists()
+
+
+def test_changed_parameters_rebuild(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    _save_image(tmp_path / "photo.png", (400, 300), noisy=True)
+    calls = []
+    optimize_image = static_build.optimize_image
+    monkeypatch.setattr(static_build, "optimize_image", lambda *args: calls.append(args) or optimize_image(*args))
+
+    manifest = build(tmp_path, "optimized", StaticManifest(), max_side=1280, jpeg_quality=85)
+    assert manifest.files["photo"].path == "optimized/photo.jpg"
+    manifest = build(tmp_path, "optimized", manifest, max_side=1280, jpeg_quality=85)
+    assert len(calls) == 1, "неизменившийся исходник не пересобирается"
+
+    smaller = build(tmp_path, "optimized", manifest, max_side=200, jpeg_quality=85)
+    assert len(calls) == 2
+    assert smaller.files["photo"].bytes < manifest.files["photo"].bytes
+    build(tmp_path, "optimized", smaller, max_side=200, jpeg_quality=60)
+    assert len(calls) == 3
@@ -0,0 +1,186 @@
+"""StaticLoader поверх поддельного пула asyncpg: кеш статики и подписка на уведомления об её изменении."""
+import asyncio
+import contextlib
+import json
+import logging
+import typing
+from pathlib import Path
+
+import pytest
+
+from src.lib import static_loader
+from src.lib.static_loader import STATIC_CHANGED_CHANNEL, StaticLoader
+
+
+class FakeDatabase:
+    """Таблицы texts и files и счётчик запросов к ним."""
+
+    def __init__(self) -> None:
+        self.texts = {"hello": "Привет"}
+        self.files = {"logo": "images/logo.png"}
+        self.queries = 0
+
+    def fetch(self, query: str) -> list[dict[str, typing.Any]]:
+        self.queries += 1
+        if "from texts" in query:
+            return [{"code": code, "text": text} for code, text in self.texts.items()]
+        if "from files" in query:
+            return [{"code": code, "path": path} for code, path in self.files.items()]
+        return []
+
+    def fetchval(self, query: str, code: str) -> typing.Any:
+        self.queries += 1
+        table = self.texts if "from texts" in query else self.files
+        return table.get(code)
+
+
+class FakeConnection:
+    def __init__(self, database: FakeDatabase) -> None:
+        self._database = database
+        self.listeners: dict[str, typing.Callable] = {}
+        self.subscribed = False
+        self._termination_listeners: list[typing.Callable] = []
+        self._closed = False
+
+    async def fetch(self, query: str) -> list[dict[str, typing.Any]]:
+        return self._database.fetch(query)
+
+    async def add_listener(self, channel: str, callback: typing.Callable) -> None:
+        self.listeners[channel] = callback
+        self.subscribed = True
+
+    async def remove_listener(self, channel: str, callback: typing.Callable) -> None:
+        assert not self._closed, "UNLISTEN на закрытом соединении"
+        del self.listeners[channel]
+
+    def add_termination_listener(self, callback: typing.Callable) -> None:
+        self._termination_listeners.append(callback)
+
+    def remove_termination_listener(self, callback: typing.Callable) -> None:
+        self._termination_listeners.remove(callback)
+
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def notify(self, table: str, code: str) -> None:
+        payload = json.dumps({"table": table, "code": code})
+        self.listeners[STATIC_CHANGED_CHANNEL](self, 0, STATIC_CHANGED_CHANNEL, payload)
+
+    def drop(self) -> None:
+        """Потерять соединение, как при перезапуске сервера."""
+        self._closed = True
+        for callback in self._termination_listeners:
+            callback(self)
+
+
+class FakePool:
+    """Выдаёт новое соединение на каждый acquire; первые failures попыток завершаются ошибкой."""
+
+    def __init__(self, database: FakeDatabase, failures: int = 0) -> None:
+        self._database = database
+        self._failures = failures
+        self.connections: list[FakeConnection] = []
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> typing.AsyncIterator[FakeConnection]:
+        if self._failures:
+            self._failures -= 1
+            raise ConnectionRefusedError("сервер недоступен")
+        connection = FakeConnection(self._database)
+        self.connections.append(connection)
+        yield connection
+
+    async def fetchval(self, query: str, *args: typing.Any) -> typing.Any:
+        return self._database.fetchval(query, *args)
+
+    @property
+    def subscribed(self) -> list[FakeConnection]:
+        """Соединения, на которых listen подписывался на уведомления."""
+        return [connection for connection in self.connections if connection.subscribed]
+
+
+def make_loader(pool: FakePool) -> StaticLoader:
+    return StaticLoader(pool, "По умолчанию", "default.png", Path("static"))  # type: ignore[arg-type]
+
+
+async def wait_until(predicate: typing.Callable[[], bool]) -> None:
+    async with asyncio.timeout(1):
+        while not predicate():
+            await asyncio.sleep(0.001)
+
+
+@pytest.fixture(autouse=True)
+def fast_retry(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(static_loader, "_LISTEN_RETRY_DELAY", 0.001)
+
+
+def test_preloaded_texts_are_served_from_memory() -> None:
+    async def test() -> None:
+        database = FakeDatabase()
+        loader = make_loader(FakePool(database))
+        await loader.preload()
+        queries = database.queries
+
+        assert await loader.get_text("hello") == "Привет"
+        assert await loader.get_text("missing") == "По умолчанию"
+        assert database.queries == queries
+        assert (loader.hits, loader.misses) == (1, 1)
+
+    asyncio.run(test())
+
+
+def test_notification_refreshes_changed_row() -> None:
+    async def test() -> None:
+        database = FakeDatabase()
+        pool = FakePool(database)
+        loader = make_loader(pool)
+        await loader.preload()
+        listening = asyncio.create_task(loader.listen())
+        await wait_until(lambda: len(pool.subscribed) == 1)
+
+        database.texts["hello"] = "Здравствуйте"
+        pool.subscribed[0].notify("texts", "hello")
+        await wait_until(lambda: loader._texts is not None and loader._texts["hello"] == "Здравствуйте")
+
+        listening.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await listening
+        assert not pool.subscribed[0].listeners, "подписка снимается при отмене"
+
+    asyncio.run(test())
+
+
+def test_listen_reconnects_and_reloads_after_drop(caplog: pytest.LogCaptureFixture) -> None:
+    async def test() -> None:
+        database = FakeDatabase()
+        pool = FakePool(database)
+        loader = make_loader(pool)
+        await loader.preload()
+        listening = asyncio.create_task(loader.listen())
+        await wait_until(lambda: len(pool.subscribed) == 1)
+
+        pool.subscribed[0].drop()
+        database.texts["hello"] = "Изменено без соединения"
+        await wait_until(lambda: len(pool.subscribed) == 2)
+        await wait_until(lambda: loader._texts is not None and loader._texts["hello"] == "Изменено без соединения")
+
+        database.texts["hello"] = "После переподключения"
+        pool.subscribed[1].notify("texts", "hello")
+        await wait_until(lambda: loader._texts is not None and loader._texts["hello"] == "После переподключения")
+        listening.cancel()
+
+    with caplog.at_level(logging.WARNING, logger=static_loader.__name__):
+        asyncio.run(test())
+    assert "потеряно" in caplog.text
+
+
+def test_listen_retries_when_database_is_unavailable(caplog: pytest.LogCaptureFixture) -> None:
+    async def test() -> None:
+        pool = FakePool(FakeDatabase(), failures=2)
+        listening = asyncio.create_task(make_loader(pool).listen())
+        await wait_until(lambda: len(pool.subscribed) == 1)
+        listening.cancel()
+
+    with caplog.at_level(logging.ERROR, logger=static_loader.__name__):
+        asyncio.run(test())
+    assert caplog.text.count("Не удалось подписаться") == 2
@@ -0,0 +1,121 @@
+"""Хранилища, не требующие PostgreSQL: в памяти, SQLite и кеш поверх них."""
+import asyncio
+import typing
+
+import pytest
+
+from src.lib.state_machine import ChatId, Context, StateCode
+from src.lib.state_machine.storages import AsyncSQLiteStorage, CachedStorage, MemoryStorage, SQLiteInMemoryStorage
+from src.lib.state_machine.storages.base import ChatSnapshot, StateMachineStorage
+
+CHAT_ID = ChatId(1)
+
+StorageFactory: typing.TypeAlias = typing.Callable[[], StateMachineStorage]
+
+STORAGES: dict[str, StorageFactory] = {
+    "memory": MemoryStorage,
+    "sqlite": SQLiteInMemoryStorage,
+    "sqlite-async": AsyncSQLiteStorage,
+    "memory+cache": lambda: CachedStorage(MemoryStorage()),
+}
+
+
+def run_with(factory: StorageFactory, test: typing.Callable[[StateMachineStorage], typing.Awaitable[None]]) -> None:
+    async def run() -> None:
+        storage = factory()
+        try:
+            await test(storage)
+        finally:
+            if isinstance(storage, AsyncSQLiteStorage):
+                await storage.close()
+
+    asyncio.run(run())
+
+
+@pytest.fixture(params=list(STORAGES))
+def storage_factory(request: pytest.FixtureRequest) -> StorageFactory:
+    return STORAGES[request.param]
+
+
+def test_new_chat_has_empty_snapshot(storage_factory: StorageFactory) -> None:
+    async def test(storage: StateMachineStorage) -> None:
+        snapshot = await storage.get_snapshot(CHAT_ID)
+        assert snapshot.state_code is None
+        assert snapshot.context == {}
+        assert await storage.restore_archived(CHAT_ID) is None
+
+    run_with(storage_factory, test)
+
+
+def test_snapshot_round_trip(storage_factory: StorageFactory) -> None:
+    async def test(storage: StateMachineStorage) -> None:
+        context = Context()
+        context["name"] = "Иван"
+        context["answers"] = [1, 2]
+        await storage.set_snapshot(CHAT_ID, ChatSnapshot(StateCode("Form"), context))
+        assert not context.is_dirty, "после записи контекст чист"
+
+        snapshot = await storage.get_snapshot(CHAT_ID)
+        assert snapshot.state_code == "Form"
+        assert snapshot.context == {"name": "Иван", "answers": [1, 2]}
+
+        snapshot.context["answers"] = [3]
+        del snapshot.context["name"]
+        snapshot.state_code = StateCode("Menu")
+        await storage.set_snapshot(CHAT_ID, snapshot)
+
+        snapshot = await storage.get_snapshot(CHAT_ID)
+        assert snapshot.state_code == "Menu"
+        assert snapshot.context == {"answers": [3]}
+
+    run_with(storage_factory, test)
+
+
+def test_state_without_context_changes(storage_factory: StorageFactory) -> None:
+    async def test(storage: StateMachineStorage) -> None:
+        await storage.set_snapshot(CHAT_ID, ChatSnapshot(StateCode("Menu"), Context()))
+        assert await storage.get_state(CHAT_ID) == "Menu"
+        assert not (await storage.get_snapshot(CHAT_ID)).context
+
+    run_with(storage_factory, test)
+
+
+def test_cache_reads_once_and_writes_through() -> None:
+    async def test(storage: StateMachineStorage) -> None:
+        assert isinstance(storage, CachedStorage)
+        snapshot = await storage.get_snapshot(CHAT_ID)
+        snapshot.state_code = StateCode("Menu")
+        snapshot.context["step"] = 1
+        await storage.set_snapshot(CHAT_ID, snapshot)
+
+        assert (await storage.get_snapshot(CHAT_ID)).context == {"step": 1}
+        assert (storage.hits, storage.misses) == (1, 1)
+        assert (await backend.get_snapshot(CHAT_ID)).context == {"step": 1}
+
+    backend = MemoryStorage()
+    run_with(lambda: CachedStorage(backend), test)
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    async def test(storage: StateMachineStorage) -> None:
+        assert isinstance(storage, CachedStorage)
+        for chat_id in (1, 2, 1, 3):
+            await storage.get_snapshot(ChatId(chat_id))
+        assert storage.evictions == 1
+
+        await storage.get_snapshot(ChatId(1))
+        await storage.get_snapshot(ChatId(2))
+        assert (storage.hits, storage.misses) == (2, 4), "вытеснен чат 2, к которому дольше всего не обращались"
+
+    run_with(lambda: CachedStorage(MemoryStorage(), max_chats=2), test)
+
+
+def test_cache_expires_entries() -> None:
+    async def test(storage: StateMachineStorage) -> None:
+        assert isinstance(storage, CachedStorage)
+        await storage.get_snapshot(CHAT_ID)
+        await storage.get_snapshot(CHAT_ID)
+        assert storage.expirations == 1
+        assert storage.misses == 2
+
+    run_with(lambda: CachedStorage(MemoryStorage(), ttl=0), test)